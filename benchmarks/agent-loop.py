@@ -0,0 +1,89 @@
+"""End-to-end agent loop without the network: the corpus queries go through mcp-client.py's
+real main() and a real mcp-server.py, with a local LLM backend in place of Gemini.
+
+Reports the time per iteration spent building the prompt, waiting for the LLM, parsing its
+response, converting arguments and in tool RPCs; "other" is the rest of the client loop.
+
+    python benchmarks/agent-loop.py --backend scripted --latency 0.2
+    python benchmarks/agent-loop.py --backend rules --repeat 5 --stream off
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+PHASES = ("prompt", "llm", "parse", "convert", "rpc", "other", "total")
+
+
+def load_client():
+    sys.path.insert(0, ROOT)  # the client imports tracing.py from the repository root
+    spec = importlib.util.spec_from_file_location("mcp_client", os.path.join(ROOT, "mcp-client.py"))
+    mcp_client = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mcp_client)
+    return mcp_client
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(iterations):
+    print(f"{len(iterations)} iterations over {len({entry['query'] for entry in iterations})} queries")
+    print(f"{'phase':<8} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'share':>7}")
+    total = sum(entry["total"] for entry in iterations) or 1
+    for name in PHASES:
+        values = [entry[name] * 1000 for entry in iterations]
+        print(
+            f"{name:<8} {statistics.mean(values):>10.2f} {percentile(values, 0.5):>10.2f} "
+            f"{percentile(values, 0.95):>10.2f} {sum(values) / 10 / total:>6.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("scripted", "rules"), default="scripted")
+    parser.add_argument("--corpus", default=os.path.join(HERE, "agent-corpus.json"))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per LLM response")
+    parser.add_argument("--repeat", type=int, default=3, help="times to run the corpus")
+    parser.add_argument("--stream", choices=("on", "off"), default="on")
+    parser.add_argument("--verbose", action="store_true", help="show the client's log")
+    args = parser.parse_args()
+
+    # the client reads its settings at import; the LLM cache would hide the backend
+    os.environ.update(
+        LLM_BACKEND=args.backend, LLM_SCRIPT=os.path.abspath(args.corpus), LLM_LATENCY=str(args.latency),
+        LLM_STREAM=args.stream, LLM_CACHE="off", MCP_LOG_LEVEL="INFO" if args.verbose else "WARNING",
+    )
+    os.environ.setdefault("CALCULATOR_RENDER", "headless")  # the server draws no panels in batch runs
+    os.chdir(ROOT)
+    mcp_client = load_client()
+    with open(args.corpus) as f:
+        queries = [entry["query"] for entry in mcp_client.json.load(f)["queries"]]
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write("\n".join(queries * args.repeat))
+    sys.argv = ["mcp-client.py", "--queries", f.name]
+    try:
+        asyncio.run(mcp_client.main())
+    finally:
+        os.unlink(f.name)
+
+    iterations = mcp_client.timings.iterations
+    if not iterations:
+        sys.exit("No iterations ran; rerun with --verbose to see the client log")
+    for entry in iterations:
+        # phases of concurrent plan calls are summed, so they can add up to more than the wall time
+        entry["other"] = max(0.0, entry["total"] - sum(entry[name] for name in mcp_client.TIMED_PHASES))
+    print(f"backend {args.backend}, latency {args.latency * 1000:.0f} ms, stream {args.stream}, "
+          f"{mcp_client.client.calls} LLM calls")
+    report(iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Per-call cost of turning the LLM's positional parameters into tool arguments.
+
+Compares the old per-call if/elif conversion, which re-read the schema every time, with the
+converters that ToolCatalogue compiles once per tool. No server or network needed.
+
+    python benchmarks/argument-conversion.py [--number 100000]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import timeit
+
+from mcp import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))  # the client imports tracing.py from the repository root
+spec = importlib.util.spec_from_file_location("mcp_client", os.path.join(os.path.dirname(HERE), "mcp-client.py"))
+mcp_client = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mcp_client)
+
+TOOLS = [
+    types.Tool(name="add", inputSchema={
+        "type": "object",
+        "properties": {"a": {"type": "integer"}, "b": {"type": "integer"}},
+        "required": ["a", "b"],
+    }),
+    types.Tool(name="verify", inputSchema={
+        "type": "object",
+        "properties": {"expression": {"type": "string"}, "expected": {"type": "string"}},
+        "required": ["expression", "expected"],
+    }),
+    types.Tool(name="int_list_to_exponential_sum", inputSchema={
+        "type": "object",
+        "properties": {"int_list": {"type": "array", "items": {"type": "integer"}}},
+        "required": ["int_list"],
+    }),
+]
+CALLS = [
+    ("add", ["5", 3]),
+    ("verify", ["sqrt(5)", "2.23606797749979"]),
+    ("int_list_to_exponential_sum", ["[73, 78, 68, 73, 65]"]),
+]
+
+
+def legacy_convert_arguments(tool, params):
+    """The conversion the client ran on every call before converters were compiled"""
+    arguments = {}
+    schema_properties = tool.inputSchema.get('properties', {})
+    param_names = list(schema_properties.keys())
+    for i, param_value in enumerate(params):
+        if i >= len(param_names):
+            break
+        param_name = param_names[i]
+        param_info = schema_properties[param_name]
+        param_type = param_info.get('type', 'string')
+        if param_type == 'integer':
+            arguments[param_name] = int(param_value)
+        elif param_type == 'number':
+            arguments[param_name] = float(param_value)
+        elif param_type == 'array':
+            if isinstance(param_value, list):
+                arguments[param_name] = param_value
+            elif isinstance(param_value, str):
+                clean_value = param_value.strip('[]')
+                if clean_value:
+                    items_type = param_info.get('items', {}).get('type', 'string')
+                    if items_type == 'integer':
+                        arguments[param_name] = [int(x.strip()) for x in clean_value.split(',')]
+                    elif items_type == 'number':
+                        arguments[param_name] = [float(x.strip()) for x in clean_value.split(',')]
+                    else:
+                        arguments[param_name] = [x.strip() for x in clean_value.split(',')]
+                else:
+                    arguments[param_name] = []
+        elif param_type == 'boolean':
+            if isinstance(param_value, str):
+                arguments[param_name] = param_value.lower() == 'true'
+            else:
+                arguments[param_name] = bool(param_value)
+        else:
+            arguments[param_name] = str(param_value)
+    return arguments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    catalogue = mcp_client.ToolCatalogue(TOOLS)
+    for name, params in CALLS:
+        tool = catalogue.get(name)
+        assert legacy_convert_arguments(tool, params) == catalogue.convert(name, params)
+
+        # the old client also found the tool with a linear scan on every call
+        legacy = timeit.timeit(
+            lambda: legacy_convert_arguments(next(t for t in TOOLS if t.name == name), params),
+            number=args.number,
+        )
+        compiled = timeit.timeit(lambda: catalogue.convert(name, params), number=args.number)
+        print(
+            f"{name:<28} before {legacy / args.number * 1e6:6.2f} us/call | "
+            f"after {compiled / args.number * 1e6:6.2f} us/call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Throughput of one client pipelining many tools/call requests on a single session.
+
+Starts mcp-server.py over stdio for each worker count and sends --calls distinct
+factorial_mod requests, first one at a time and then all at once with asyncio.gather,
+and prints calls per second for both.
+
+    python benchmarks/concurrency.py [--workers 1 2 4] [--calls 32] [--n 1000000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp-server.py")
+MODULUS = 1_000_000_007
+
+
+async def run(workers, calls, n):
+    env = dict(os.environ, CALCULATOR_PROCESS_WORKERS=str(workers), CALCULATOR_SESSION_CONCURRENCY=str(calls))
+    params = StdioServerParameters(command=sys.executable, args=[SERVER], env=env)
+    with open(os.devnull, "w") as devnull:
+        async with stdio_client(params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                # start the workers before timing anything
+                await asyncio.gather(*(
+                    session.call_tool("factorial_mod", {"n": i, "m": MODULUS}) for i in range(workers)
+                ))
+
+                # distinct n for every request so the result cache never answers
+                start = time.perf_counter()
+                for i in range(calls):
+                    await session.call_tool("factorial_mod", {"n": n + i, "m": MODULUS})
+                sequential = calls / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                await asyncio.gather(*(
+                    session.call_tool("factorial_mod", {"n": n + calls + i, "m": MODULUS}) for i in range(calls)
+                ))
+                pipelined = calls / (time.perf_counter() - start)
+    return sequential, pipelined
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, min(2, cores), cores}))
+    parser.add_argument("--calls", type=int, default=32)
+    parser.add_argument("--n", type=int, default=1_000_000, help="n for factorial_mod")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        sequential, pipelined = await run(workers, args.calls, args.n)
+        print(f"workers {workers:>3} | sequential {sequential:7.2f} calls/s | pipelined {pipelined:7.2f} calls/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
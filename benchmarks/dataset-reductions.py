@@ -0,0 +1,90 @@
+"""Throughput of the dataset_* reductions over a memory-mapped file.
+
+Writes a float64 dataset of --size-mb to a temporary CALCULATOR_DATA_DIR, loads mcp-server.py
+in-process (no stdio) and times dataset_sum, dataset_exp_sum and dataset_min_max against
+reading the whole file into memory first and summing it. The file was just written, so it
+is usually in the page cache and the numbers show memory rather than disk bandwidth.
+
+It then rewrites a small dataset between two identical evaluate_plan calls and exits with status 1
+if the second call still returns the old sum from the result cache.
+
+    python benchmarks/dataset-reductions.py [--size-mb 1024] [--repeat 3]
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def check_plan_sees_rewrites(mcp_server, data_dir):
+    """True when evaluate_plan reads a dataset again after its file changed"""
+    path = os.path.join(data_dir, "rewritten.int64")
+    plan = [{"id": "total", "function_name": "dataset_sum", "parameters": ["rewritten"]}]
+    np.arange(10, dtype="<i8").tofile(path)
+    before = asyncio.run(mcp_server.evaluate_plan(plan))["result"]
+    np.arange(100, dtype="<i8").tofile(path)
+    after = asyncio.run(mcp_server.evaluate_plan(plan))["result"]
+    print(f"evaluate_plan dataset_sum before/after rewrite: {before} / {after}")
+    return (before, after) == (45, 4950)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, "values.float64")
+        count = args.size_mb * 1024 * 1024 // 8
+        rng = np.random.default_rng(0)
+        with open(path, "wb") as f:
+            for start in range(0, count, 1 << 22):
+                rng.random(min(1 << 22, count - start)).tofile(f)
+
+        os.environ["CALCULATOR_DATA_DIR"] = data_dir
+        os.environ.setdefault("CALCULATOR_RENDER", "headless")
+        os.environ.setdefault("CALCULATOR_PROCESS_WORKERS", "0")
+        sys.path.insert(0, ROOT)  # the server imports logs.py and tracing.py from the repository root
+        spec = importlib.util.spec_from_file_location("mcp_server", os.path.join(ROOT, "mcp-server.py"))
+        mcp_server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mcp_server)
+
+        gigabytes = count * 8 / 1e9
+        print(f"{count:,} float64 values, {gigabytes:.2f} GB")
+        cases = [
+            ("read file + sum", lambda: float(np.fromfile(path).sum())),
+            ("dataset_sum", lambda: mcp_server.dataset_sum("values")),
+            ("dataset_exp_sum", lambda: mcp_server.dataset_exp_sum("values")),
+            ("dataset_min_max", lambda: mcp_server.dataset_min_max("values")),
+        ]
+        for name, fn in cases:
+            seconds, result = timed(fn, args.repeat)
+            print(f"{name:<16} {seconds * 1000:9.1f} ms {gigabytes / seconds:7.2f} GB/s   {result}")
+
+        if not check_plan_sees_rewrites(mcp_server, data_dir):
+            print("REGRESSION: evaluate_plan returned a cached result for a rewritten dataset")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Cost of sending large numeric arrays as JSON lists versus packed base64 (see packed.py).
+
+Starts mcp-server.py over stdio and times, for each size, an add_list call with the list as an
+argument (validated into a Python list on the server), an int_list_to_exponential_sum call with
+the same list (a NumPy tool, which gets a packed argument as the buffer itself) and a
+strings_to_chars_to_int call returning a list of that size, once as plain JSON and once packed.
+Times include the client's own encoding and decoding (result_to_text and result_value). Without
+packing FastMCP returns one content item per list element, so JSON results above
+--json-result-limit elements are skipped.
+
+    python benchmarks/packed-transport.py [--sizes 1000 10000 100000 1000000] [--repeat 3]
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)  # the client imports packed.py and tracing.py from the repository root
+os.environ.setdefault("LLM_BACKEND", "rules")  # no LLM calls here; skip the Gemini client
+spec = importlib.util.spec_from_file_location("mcp_client", os.path.join(ROOT, "mcp-client.py"))
+mcp_client = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mcp_client)
+
+import packed
+from mcp import StdioServerParameters
+
+
+async def timed(session, name, arguments, min_items, repeat):
+    """Median ms of a call: pack the arguments, call, unpack the result into a Python value"""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        sent = packed.pack_arguments(arguments(i), min_items) if min_items else arguments(i)
+        meta = {"packed": min_items} if min_items else None
+        result = await session.call_tool(name, sent, meta=meta)
+        if result.isError:
+            raise RuntimeError(result.content[0].text)
+        mcp_client.result_value(mcp_client.result_to_text(result))
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json-result-limit", type=int, default=100_000)
+    args = parser.parse_args()
+
+    env = dict(os.environ, CALCULATOR_RENDER="headless", CALCULATOR_CACHE_ENTRIES="0")
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(ROOT, "mcp-server.py")], env=env)
+    entry = await mcp_client.PooledSession(params).open()
+    try:
+        print(
+            f"{'size':>9} | {'list arg json':>13} {'packed':>9} | {'array arg json':>14} {'packed':>9} | "
+            f"{'result json':>11} {'packed':>9}   (median ms)"
+        )
+        for size in args.sizes:
+            numbers = [random.randint(0, 10**12) for _ in range(size)]
+            words = ["".join(random.choices("ABCDEFGHIJ", k=size)) for _ in range(2 * args.repeat)]
+
+            def add_list(i):
+                return {"l": numbers}
+
+            def exp_sum(i):
+                return {"int_list": numbers, "output": "log"}
+
+            def chars(offset):
+                # a fresh word per call so the result cache never answers
+                return lambda i: {"string": words[offset + i]}
+
+            argument_json = await timed(entry, "add_list", add_list, 0, args.repeat)
+            argument_packed = await timed(entry, "add_list", add_list, 1, args.repeat)
+            array_json = await timed(entry, "int_list_to_exponential_sum", exp_sum, 0, args.repeat)
+            array_packed = await timed(entry, "int_list_to_exponential_sum", exp_sum, 1, args.repeat)
+            result_packed = await timed(entry, "strings_to_chars_to_int", chars(0), 1, args.repeat)
+            if size <= args.json_result_limit:
+                result_json = f"{await timed(entry, 'strings_to_chars_to_int', chars(args.repeat), 0, args.repeat):11.1f}"
+            else:
+                result_json = f"{'skipped':>11}"
+            print(
+                f"{size:>9} | {argument_json:13.1f} {argument_packed:9.1f} | {array_json:14.1f} {array_packed:9.1f} | "
+                f"{result_json} {result_packed:9.1f}"
+            )
+    finally:
+        await entry.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
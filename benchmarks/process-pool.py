@@ -0,0 +1,80 @@
+"""Latency of light tool calls while a heavy tool call runs on the same session.
+
+Starts mcp-server.py over stdio once inline (CALCULATOR_PROCESS_WORKERS=0) and once with the
+process pool, then fires `add` calls at a steady rate while `factorial_mod` grinds in the
+background and prints the light-call latency percentiles for each mode.
+
+    python benchmarks/process-pool.py [--workers 4] [--light 200] [--heavy-n 10000000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp-server.py")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def timed_call(session, name, arguments):
+    start = time.perf_counter()
+    await session.call_tool(name, arguments)
+    return time.perf_counter() - start
+
+
+async def run(workers, light_calls, heavy_n):
+    env = dict(os.environ, CALCULATOR_PROCESS_WORKERS=str(workers))
+    params = StdioServerParameters(command=sys.executable, args=[SERVER], env=env)
+    with open(os.devnull, "w") as devnull:
+        return await _run(params, devnull, light_calls, heavy_n)
+
+
+async def _run(params, errlog, light_calls, heavy_n):
+    async with stdio_client(params, errlog=errlog) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            # first heavy call starts the workers; keep it out of the measurement
+            await session.call_tool("factorial_mod", {"n": 10, "m": 1_000_000_007})
+
+            heavy = asyncio.create_task(
+                timed_call(session, "factorial_mod", {"n": heavy_n, "m": 1_000_000_007})
+            )
+            await asyncio.sleep(0.05)
+            latencies = []
+            for i in range(light_calls):
+                latencies.append(await timed_call(session, "add", {"a": i, "b": 1}))
+                await asyncio.sleep(0.005)
+            heavy_seconds = await heavy
+    return latencies, heavy_seconds
+
+
+def report(label, latencies, heavy_seconds):
+    ms = [x * 1000 for x in latencies]
+    print(
+        f"{label:<14} heavy {heavy_seconds:6.2f}s | add p50 {statistics.median(ms):7.2f}ms "
+        f"p99 {percentile(ms, 0.99):7.2f}ms max {max(ms):7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--light", type=int, default=200, help="number of add calls")
+    parser.add_argument("--heavy-n", type=int, default=10_000_000, help="n for factorial_mod")
+    args = parser.parse_args()
+
+    for label, workers in (("inline", 0), (f"pool({args.workers})", args.workers)):
+        latencies, heavy_seconds = await run(workers, args.light, args.heavy_n)
+        report(label, latencies, heavy_seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
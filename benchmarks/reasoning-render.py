@@ -0,0 +1,55 @@
+"""Latency of show_reasoning calls for large step lists in each CALCULATOR_RENDER mode.
+
+Starts mcp-server.py over stdio once per mode, with rich forced to render colour as it would
+on a terminal (the panels go to /dev/null), and prints the median call latency per list size.
+
+    python benchmarks/reasoning-render.py [--steps 10 100 1000] [--calls 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp-server.py")
+MODES = ("interactive", "deferred", "headless")
+
+
+async def measure(mode, sizes, calls):
+    env = dict(os.environ, CALCULATOR_RENDER=mode, FORCE_COLOR="1", COLUMNS="120")
+    params = StdioServerParameters(command=sys.executable, args=[SERVER], env=env)
+    medians = {}
+    with open(os.devnull, "w") as devnull:
+        async with stdio_client(params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                await session.call_tool("show_reasoning", {"steps": ["warm up"]})
+                for size in sizes:
+                    steps = [f"Step {i}: compute the next partial result and check it against the last one." for i in range(size)]
+                    latencies = []
+                    for _ in range(calls):
+                        start = time.perf_counter()
+                        await session.call_tool("show_reasoning", {"steps": steps})
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    medians[size] = statistics.median(latencies)
+    return medians
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}" + "".join(f"{f'{size} steps':>14}" for size in args.steps))
+    for mode in MODES:
+        medians = await measure(mode, args.steps, args.calls)
+        print(f"{mode:<12}" + "".join(f"{medians[size]:>11.2f} ms" for size in args.steps))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Cold start of mcp-server.py: time from process spawn to the initialize response and to the
+first completed tools/call.
+
+Each run spawns a fresh server over stdio. Medians are compared against a saved baseline, and
+the script exits with status 1 when either median is more than --tolerance slower.
+
+    python benchmarks/startup.py --save        # record the baseline for this machine
+    python benchmarks/startup.py               # check against it
+    python benchmarks/startup.py --max-initialize-ms 800 --max-first-call-ms 900
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER = os.path.join(os.path.dirname(HERE), "mcp-server.py")
+BASELINE = os.path.join(HERE, "startup_baseline.json")
+
+
+async def measure_once():
+    params = StdioServerParameters(command=sys.executable, args=[SERVER], env=dict(os.environ))
+    with open(os.devnull, "w") as devnull:
+        start = time.perf_counter()
+        async with stdio_client(params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                initialized = time.perf_counter()
+                await session.call_tool("add", {"a": 1, "b": 2})
+                first_call = time.perf_counter()
+    return (initialized - start) * 1000, (first_call - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--save", action="store_true", help="write the medians as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument("--max-initialize-ms", type=float, help="absolute budget instead of the baseline")
+    parser.add_argument("--max-first-call-ms", type=float, help="absolute budget instead of the baseline")
+    args = parser.parse_args()
+
+    await measure_once()  # warm the OS file cache
+    samples = [await measure_once() for _ in range(args.runs)]
+    result = {
+        "initialize_ms": statistics.median(s[0] for s in samples),
+        "first_call_ms": statistics.median(s[1] for s in samples),
+    }
+    print(f"spawn -> initialize  median {result['initialize_ms']:7.1f} ms")
+    print(f"spawn -> first call  median {result['first_call_ms']:7.1f} ms")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    limits = {"initialize_ms": args.max_initialize_ms, "first_call_ms": args.max_first_call_ms}
+    if None in limits.values() and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, limit in limits.items():
+            if limit is None:
+                limits[key] = baseline[key] * (1 + args.tolerance)
+    failed = [key for key, limit in limits.items() if limit is not None and result[key] > limit]
+    for key in failed:
+        print(f"REGRESSION: {key} {result[key]:.1f} ms exceeds {limits[key]:.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
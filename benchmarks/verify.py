@@ -0,0 +1,62 @@
+"""Cost of verify's list comparison: the old per-element generator against compare_values.
+
+Loads mcp-server.py in-process (no stdio) and compares equal lists, lists with a few
+mismatches and lists that differ only within the relative tolerance.
+
+    python benchmarks/verify.py [--sizes 1000 100000 1000000]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+os.environ.setdefault("CALCULATOR_RENDER", "headless")
+os.environ.setdefault("CALCULATOR_PROCESS_WORKERS", "0")
+sys.path.insert(0, ROOT)  # the server imports logs.py and tracing.py from the repository root
+spec = importlib.util.spec_from_file_location("mcp_server", os.path.join(ROOT, "mcp-server.py"))
+mcp_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mcp_server)
+
+
+def legacy_compare(actual_list, expected_list):
+    """The list branch of verify before the verification engine"""
+    return all(
+        abs(float(actual) - float(expected)) < 1e-10
+        for actual, expected in zip(actual_list, expected_list)
+    )
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    mcp_server.compare_values([0.0], [0.0])  # import numpy outside the timings
+    print(f"{'size':>9} {'case':<12} {'legacy ms':>10} {'verdict':>8} {'engine ms':>10} {'verdict':>8}")
+    for size in args.sizes:
+        actual = [random.uniform(-1e6, 1e6) for _ in range(size)]
+        mismatched = list(actual)
+        mismatched[-1] += 1.0
+        cases = {
+            "equal": list(actual),
+            "last differs": mismatched,
+            "within rtol": [value * (1 + 1e-12) for value in actual],
+        }
+        for case, expected in cases.items():
+            legacy, legacy_equal = timed(legacy_compare, actual, expected)
+            engine, report = timed(mcp_server.compare_values, actual, expected)
+            print(f"{size:>9} {case:<12} {legacy:>10.2f} {legacy_equal!s:>8} {engine:>10.2f} {report['equal']!s:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Handles of results kept on the server, shared by mcp-client.py and mcp-server.py.
+
+A client that asks for it gets every large result back as a short handle with a size and a
+preview, {"handle": "@r1a2b3c4d", "type": "list", "length": 1000, ...}, while the value stays
+in the server's result store. A handle passed as a tool argument, on its own or inside a list,
+stands for the stored value, so large intermediate results never have to enter the prompt.
+"""
+import os
+
+HANDLE_PREFIX = "@r"
+HANDLE_DIGITS = 8
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def new_handle():
+    return HANDLE_PREFIX + os.urandom(HANDLE_DIGITS // 2).hex()
+
+
+def is_handle(value):
+    return (
+        isinstance(value, str)
+        and len(value) == len(HANDLE_PREFIX) + HANDLE_DIGITS
+        and value.startswith(HANDLE_PREFIX)
+        and _HEX_DIGITS.issuperset(value[len(HANDLE_PREFIX):])
+    )
@@ -0,0 +1,48 @@
+"""Leveled logging for mcp-client.py and mcp-server.py that never writes to stdout.
+
+A log call only checks the level and puts the record on a queue; a background thread writes it
+to stderr or a file. Records below the level are dropped before any formatting, so disabled
+debug logging costs one comparison. The most recent records are also kept in memory.
+"""
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_buffers = {}
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` formatted records"""
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+
+def setup_logging(name, level="INFO", path=None, capacity=1000):
+    """Logger `name` writing through a queue to path, or to stderr when path is None.
+    Returns the logger and its ring buffer of recent records."""
+    logger = logging.getLogger(name)
+    if name in _buffers:
+        return logger, _buffers[name]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    formatter = logging.Formatter(LOG_FORMAT)
+    output = logging.FileHandler(path) if path else logging.StreamHandler(sys.stderr)
+    ring = _buffers[name] = RingBufferHandler(capacity)
+    for handler in (output, ring):
+        handler.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, output, ring)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger, ring
@@ -1,33 +1,497 @@
 import os
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters, types
-from mcp.client.stdio import stdio_client
+from mcp.client.stdio import get_default_environment, stdio_client
 import asyncio
+import contextlib
+import contextvars
 from google import genai
 #from google.genai import types
 from concurrent.futures import TimeoutError
 from functools import partial
+import hashlib
+import importlib.metadata
 import json
+import re
+import sqlite3
 import sys
+import threading
+import time
+
+import handles
+import logs
+import packed
+import tracing
 
 # Load environment variables from .env file
 load_dotenv()
 
 
 
-# Access your API key and initialize Gemini client correctly
-api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
 
+# Logging
+# Progress goes through a queue to stderr (or MCP_LOG_FILE) at MCP_LOG_LEVEL. The per-step
+# details (schemas, raw results, parsed calls) are DEBUG and only formatted at that level.
+logger, log_buffer = logs.setup_logging("agent", os.getenv("MCP_LOG_LEVEL", "INFO"), os.getenv("MCP_LOG_FILE"))
 
 max_iterations = 6
-last_response = None
-iteration = 0
-iteration_response = []
 
-async def generate_with_timeout(client, prompt, timeout=10):
-    """Generate content with a timeout"""
-    print("Starting LLM generation...")
+# Conversation history sent back to the LLM each iteration. The token count is estimated from
+# the character count; old turns are dropped and long results shortened to stay in budget.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+MAX_TURN_CHARS = int(os.getenv("HISTORY_MAX_TURN_CHARS", "800"))
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Rough token count of a prompt string"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class ConversationHistory:
+    """Agent turns, each appended once and rendered within a token budget.
+    The first turn (usually the reasoning plan) is always kept; the oldest turns after it
+    are dropped first and replaced by a single "steps omitted" line."""
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, max_turn_chars=MAX_TURN_CHARS):
+        self.token_budget = token_budget
+        self.max_turn_chars = max_turn_chars
+        self.turns = []
+        self.tokens = 0
+        self.omitted = 0
+
+    def append(self, text):
+        if len(text) > self.max_turn_chars:
+            keep = self.max_turn_chars // 2
+            text = f"{text[:keep]} ...[{len(text) - 2 * keep} characters elided]... {text[-keep:]}"
+        self.turns.append(text)
+        self.tokens += estimate_tokens(text)
+        while self.tokens > self.token_budget and len(self.turns) > 2:
+            self.tokens -= estimate_tokens(self.turns.pop(1))
+            self.omitted += 1
+
+    def render(self, query):
+        """The query followed by the kept turns"""
+        if not self.turns:
+            return query
+        parts = [query, self.turns[0]]
+        if self.omitted:
+            parts.append(f"({self.omitted} earlier steps omitted)")
+        parts.extend(self.turns[1:])
+        return "\n\n".join(parts) + "  What should I do next?"
+
+    def __len__(self):
+        return len(self.turns)
+
+# Tracing
+# Every LLM call, parse, argument conversion and tool call is a span (see tracing.py). Spans are
+# appended to MCP_TRACE_FILE as JSON lines when it is set, and main() writes a Prometheus text
+# snapshot of their metrics to MCP_METRICS_FILE. Each query is one trace; its id goes to the
+# server with every tools/call so the server's tool spans join it.
+TRACE_PATH = os.getenv("MCP_TRACE_FILE")
+METRICS_PATH = os.getenv("MCP_METRICS_FILE")
+tracer = tracing.Tracer("client", TRACE_PATH)
+
+# Iteration timings
+# Wall time of each agent phase per iteration, so client and server overhead can be told apart
+# from waiting on the LLM. They are summed from the spans; phases of concurrent calls in a plan
+# are summed too. Queries running side by side each track their own iteration in a context variable.
+SPAN_PHASES = {
+    "agent.prompt": "prompt",
+    "llm.generate": "llm",
+    "llm.extract": "parse",
+    "llm.parse": "parse",
+    "tool.convert": "convert",
+    "tool.call": "rpc",
+}
+TIMED_PHASES = ("prompt", "llm", "parse", "convert", "rpc")
+
+class AgentTimings:
+    """Seconds spent in each phase, one dict per iteration"""
+
+    def __init__(self):
+        self.iterations = []
+        self._current = contextvars.ContextVar("iteration", default=None)
+
+    def start_iteration(self, query):
+        entry = dict.fromkeys(TIMED_PHASES, 0.0) | {"query": query, "total": 0.0}
+        self.iterations.append(entry)
+        self._current.set((entry, time.perf_counter()))
+
+    def end_iteration(self):
+        entry, started = self._current.get()
+        entry["total"] = time.perf_counter() - started
+        return entry
+
+    def record(self, span):
+        """Tracer listener: add a finished span to its phase of the calling task's iteration"""
+        phase = SPAN_PHASES.get(span["name"])
+        current = self._current.get()
+        if phase is not None and current is not None:
+            current[0][phase] += span["duration_ms"] / 1000
+
+    def format(self, entry):
+        return ", ".join(f"{name} {entry[name] * 1000:.1f} ms" for name in (*TIMED_PHASES, "total"))
+
+timings = AgentTimings()
+tracer.listeners.append(timings.record)
+
+# LLM response cache
+# Responses are stored in SQLite keyed by model and a hash of the prompt, so repeated queries
+# and regression runs replay without calling the model. LLM_CACHE=off disables the cache and
+# LLM_CACHE=refresh ignores stored answers but still records new ones.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+# local backends get their own cache namespace so their answers never replay as the model's
+LLM_MODEL = "gemini-2.0-flash" if LLM_BACKEND == "gemini" else f"local-{LLM_BACKEND}"
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "on")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+class CachedResponse:
+    """Stands in for a generate_content response replayed from the cache"""
+
+    def __init__(self, text):
+        self.text = text
+
+class LLMResponseCache:
+    """SQLite-backed cache of LLM response texts with a TTL and size-based LRU eviction"""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, text TEXT, size INTEGER, created REAL, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.db.commit()
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def get(self, model, prompt):
+        """Stored response text for this model and prompt, or None"""
+        key = self.key(model, prompt)
+        now = time.time()
+        row = self.db.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] + self.ttl < now:
+            if row is not None:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, model, prompt, text):
+        now = time.time()
+        size = len(text.encode())
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (self.key(model, prompt), model, text, size, now, now),
+        )
+        self.db.execute("DELETE FROM responses WHERE created + ? < ?", (self.ttl, now))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            # drop least recently used entries until the total fits again
+            for key, entry_size in self.db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= entry_size
+        self.db.commit()
+
+    def stats(self):
+        entries, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+llm_cache = LLMResponseCache() if LLM_CACHE_MODE != "off" else None
+
+# Streaming
+# With LLM_STREAM on, the response is read chunk by chunk and the rest of the stream is dropped
+# as soon as the first JSON object or array (the tool call or plan) is complete, so the tool
+# can be dispatched without waiting for trailing tokens.
+LLM_STREAM = os.getenv("LLM_STREAM", "on") != "off"
+
+class JsonStreamScanner:
+    """Finds the first complete JSON object or array in text that arrives in pieces.
+    Anything before it, such as a ```json code fence, is skipped."""
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, chunk):
+        """Add a chunk; returns the JSON text once the value closes, otherwise None"""
+        position = len(self.text)
+        self.text += chunk
+        for i in range(position, len(self.text)):
+            char = self.text[i]
+            if self.start is None:
+                if char in "{[":
+                    self.start = i
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.text[self.start:i + 1]
+        return None
+
+def first_json_value(text):
+    """The first complete JSON object or array in text, or the text itself if there is none"""
+    return JsonStreamScanner().feed(text) or text
+
+async def stream_first_json(client, prompt):
+    """Stream a response and return as soon as its first JSON value is complete"""
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        # runs in a worker thread; the SDK stream is a blocking iterator
+        try:
+            stream = client.models.generate_content_stream(model=LLM_MODEL, contents=prompt)
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk.text or "")
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+    loop.run_in_executor(None, produce)
+    scanner = JsonStreamScanner()
+    started = time.perf_counter()
+    try:
+        while (chunk := await chunks.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            found = scanner.feed(chunk)
+            if found is not None:
+                logger.info("LLM tool call complete after %.0f ms, stream dropped", (time.perf_counter() - started) * 1000)
+                return found
+        return scanner.text
+    finally:
+        stop.set()
+
+# LLM backends
+# Besides Gemini the agent can run against local backends that need no network: "scripted"
+# replays canned responses per query from a JSON script and "rules" derives the calls for a few
+# known query shapes. Both mimic the parts of the genai client the agent uses (models.generate_content
+# and models.generate_content_stream) and can add a fixed latency per response.
+LLM_SCRIPT = os.getenv("LLM_SCRIPT", os.path.join("benchmarks", "agent-corpus.json"))
+LLM_LATENCY = float(os.getenv("LLM_LATENCY", "0"))
+LLM_STREAM_CHUNK = int(os.getenv("LLM_STREAM_CHUNK", "16"))
+
+def prompt_query(prompt):
+    """The user query in an agent prompt and how many iterations already ran for it"""
+    rendered = prompt.rsplit("\n\nQuery: ", 1)[-1]
+    done = [int(n) for n in re.findall(r"^User: In the (\d+) iteration ", rendered, re.MULTILINE)]
+    return rendered.split("\n\n", 1)[0].strip(), max(done, default=0)
+
+def prompt_results(prompt):
+    """Result texts of the calls so far, oldest first"""
+    rendered = prompt.rsplit("\n\nQuery: ", 1)[-1]
+    return re.findall(
+        r"and the function returned (.*?)\. (?:Now proceed|Verified|Let's verify)", rendered, re.DOTALL)
+
+class LocalLLM:
+    """Base for local backends: subclasses implement respond(prompt)"""
+
+    def __init__(self, latency=LLM_LATENCY, chunk_chars=LLM_STREAM_CHUNK):
+        self.latency = latency
+        self.chunk_chars = max(1, chunk_chars)
+        self.models = self
+        self.calls = 0
+
+    def respond(self, prompt):
+        raise NotImplementedError
+
+    def generate_content(self, *, model, contents, config=None):
+        self.calls += 1
+        text = self.respond(contents)
+        time.sleep(self.latency)
+        return CachedResponse(text)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        self.calls += 1
+        text = self.respond(contents)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for chunk in chunks:
+            # the latency is spread over the chunks, like tokens arriving from the model
+            time.sleep(self.latency / len(chunks))
+            yield CachedResponse(chunk)
+
+class ScriptedLLM(LocalLLM):
+    """Replays a fixed list of responses for each query in a script.
+    The response for iteration n is the n-th entry; the last one repeats once they run out."""
+
+    def __init__(self, script, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            data = json.load(f)
+        return cls({entry["query"]: entry["responses"] for entry in data["queries"]}, **kwargs)
+
+    def respond(self, prompt):
+        query, done = prompt_query(prompt)
+        responses = self.script.get(query)
+        if not responses:
+            raise ValueError(f"No scripted responses for query: {query!r}")
+        response = responses[min(done, len(responses) - 1)]
+        return response if isinstance(response, str) else json.dumps(response)
+
+def _scalar(result):
+    """A single-valued result text such as "[5]" or "['5']" as the bare value,
+    or the handle of a result kept on the server"""
+    match = re.search(r'"handle": "(@r[0-9a-f]+)"', result)
+    return match[1] if match else result.strip("[]'\" ")
+
+def _plan_result(result):
+    """The "result" of an evaluate_plan result text"""
+    return json.loads(result.strip()[1:-1])["result"]
+
+RULES = [
+    # a chain of arithmetic in one evaluate_plan call, then one verify
+    (r"sum of (?:the )?first two prime numbers.*square root", lambda m: [
+        lambda results: {"function_name": "evaluate_plan", "parameters": [[
+            {"id": "a", "function_name": "add", "parameters": [2, 3]},
+            {"id": "b", "function_name": "sqrt", "parameters": ["$a"]},
+        ]]},
+        lambda results: {"function_name": "verify", "parameters": ["sqrt(2 + 3)", str(_plan_result(results[-1]))]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_plan_result(results[-2])]},
+    ]),
+    # ASCII values of a word, then the sum of their exponentials
+    (r"ASCII values of (?:the )?characters in (\w+).*exponential", lambda m: [
+        lambda results: {"function_name": "strings_to_chars_to_int", "parameters": [m[1]]},
+        lambda results: {"function_name": "int_list_to_exponential_sum",
+                         "parameters": ["[" + results[-1].replace("'", "").strip("[]") + "]"]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_scalar(results[-1])]},
+    ]),
+    # ASCII values of two words and the sum of each, as one plan
+    (r"ASCII values of (?:the )?characters in (\w+) and (\w+) and add", lambda m: [
+        lambda results: [
+            {"id": "a", "function_name": "strings_to_chars_to_int", "parameters": [m[1]]},
+            {"id": "b", "function_name": "strings_to_chars_to_int", "parameters": [m[2]]},
+            {"id": "c", "function_name": "add_list", "parameters": ["$a"]},
+            {"id": "d", "function_name": "add_list", "parameters": ["$b"]},
+        ],
+        lambda results: {"function_name": "FINAL_ANSWER",
+                         "parameters": [f"{_scalar(results[-2])}, {_scalar(results[-1])}"]},
+    ]),
+    (r"(?:add|sum of) (-?\d+) and (-?\d+)", lambda m: [
+        lambda results: {"function_name": "add", "parameters": [int(m[1]), int(m[2])]},
+        lambda results: {"function_name": "verify", "parameters": [f"{m[1]} + {m[2]}", _scalar(results[-1])]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_scalar(results[-2])]},
+    ]),
+    (r"(-?\d+) to the power (?:of )?(-?\d+)", lambda m: [
+        lambda results: {"function_name": "power", "parameters": [int(m[1]), int(m[2]), "summary"]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_scalar(results[-1])]},
+    ]),
+    (r"factorial of (\d+)", lambda m: [
+        lambda results: {"function_name": "factorial", "parameters": [int(m[1]), "summary"]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_scalar(results[-1])]},
+    ]),
+    (r"(\d+)(?:st|nd|rd|th) fibonacci", lambda m: [
+        lambda results: {"function_name": "fibonacci_nth", "parameters": [int(m[1]), "hex"]},
+        lambda results: {"function_name": "FINAL_ANSWER", "parameters": [_scalar(results[-1])]},
+    ]),
+]
+
+class RuleBasedLLM(LocalLLM):
+    """Answers the query shapes in RULES step by step, using the results in the history.
+    Every query starts with a show_reasoning call, as the system prompt asks."""
+
+    def __init__(self, rules=RULES, **kwargs):
+        super().__init__(**kwargs)
+        self.rules = [(re.compile(pattern, re.IGNORECASE), steps) for pattern, steps in rules]
+
+    def respond(self, prompt):
+        query, done = prompt_query(prompt)
+        for pattern, steps in self.rules:
+            match = pattern.search(query)
+            if match:
+                break
+        else:
+            return "I'm sorry, I can only help with mathematical queries."
+        if done == 0:
+            return json.dumps({"function_name": "show_reasoning", "parameters": [
+                f"Solve: {query} This is an arithmetic problem."]})
+        steps = steps(match)
+        return json.dumps(steps[min(done - 1, len(steps) - 1)](prompt_results(prompt)))
+
+def make_llm_client(backend=LLM_BACKEND):
+    """The client for LLM_BACKEND: the Gemini SDK client or a local backend"""
+    if backend == "gemini":
+        # Access your API key and initialize Gemini client correctly
+        return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    if backend == "scripted":
+        return ScriptedLLM.from_file(LLM_SCRIPT)
+    if backend == "rules":
+        return RuleBasedLLM()
+    raise ValueError(f"Unknown LLM_BACKEND {backend!r}, expected gemini, scripted or rules")
+
+client = make_llm_client()
+
+async def generate_with_timeout(client, prompt, timeout=10, cache=None):
+    """Generate content with a timeout, answering from the response cache when possible"""
+    cache = llm_cache if cache is None else cache
+    if cache is not None and LLM_CACHE_MODE != "refresh":
+        text = cache.get(LLM_MODEL, prompt)
+        if text is not None:
+            logger.info("LLM response served from cache")
+            tracing.annotate(cached=True)
+            return CachedResponse(text)
+
+    logger.info("Starting LLM generation...")
+    if LLM_STREAM and hasattr(client.models, "generate_content_stream"):
+        try:
+            text = await asyncio.wait_for(stream_first_json(client, prompt), timeout=timeout)
+            tracing.annotate(streamed=True)
+        except TimeoutError:
+            logger.error("LLM generation timed out!")
+            raise
+        except Exception as e:
+            logger.error("Error in LLM generation: %s", e)
+            raise
+        if cache is not None and text:
+            cache.put(LLM_MODEL, prompt, text)
+        return CachedResponse(text)
+
     try:
         # Convert the synchronous generate_content call to run in a thread
         loop = asyncio.get_event_loop()
@@ -35,379 +499,867 @@ async def generate_with_timeout(client, prompt, timeout=10):
             loop.run_in_executor(
                 None, 
                 lambda: client.models.generate_content(
-                    model="gemini-2.0-flash",
+                    model=LLM_MODEL,
                     contents=prompt
                 )
             ),
             timeout=timeout
         )
-        print("LLM generation completed")
-        return response
+        logger.info("LLM generation completed")
     except TimeoutError:
-        print("LLM generation timed out!")
+        logger.error("LLM generation timed out!")
         raise
     except Exception as e:
-        print(f"Error in LLM generation: {e}")
+        logger.error("Error in LLM generation: %s", e)
         raise
+    if cache is not None and response.text:
+        cache.put(LLM_MODEL, prompt, response.text)
+    return response
+
+# Packed transport
+# Numeric arrays of at least PACK_MIN_ITEMS elements go to the server packed (see packed.py), and
+# the server is asked to pack array results the same way. 0 turns packing off.
+PACK_MIN_ITEMS = int(os.getenv("MCP_PACK_MIN_ITEMS", str(packed.MIN_ITEMS)))
+
+def is_packed_result(result):
+    return bool(result.meta and result.meta.get("packed"))
+
+# Result handles
+# Results whose text would be longer than RESULT_HANDLE_CHARS stay on the server and come back as
+# a handle with a size and a preview (see handles.py). The prompt shows the handle, the LLM passes
+# it on as a parameter, and only FINAL_ANSWER fetches the value behind it. 0 turns handles off.
+RESULT_HANDLE_CHARS = int(os.getenv("MCP_RESULT_HANDLE_CHARS", "400"))
+
+def skips_output_schema(result):
+    """Packed and handle results are not in the shape of the tool's output schema"""
+    return bool(result.meta and (result.meta.get("packed") or result.meta.get("handles")))
+
+async def expand_handles(session, value):
+    """value with every result handle in it replaced by the full value from the server"""
+    if isinstance(value, list):
+        return [await expand_handles(session, item) for item in value]
+    if handles.is_handle(value):
+        try:
+            contents = await session.read_resource(f"result://handles/{value}")
+        except Exception as e:
+            logger.warning("Could not fetch the value of %s: %s", value, e)
+            return value
+        return json.loads(contents.contents[0].text)
+    return value
+
+def result_to_text(result):
+    """Text of a tool result: a list with one string per content item"""
+    if hasattr(result, 'content') and is_packed_result(result):
+        # one JSON list for the whole array, as a single content item
+        return [json.dumps(packed.unpack(json.loads(item.text)).tolist()) for item in result.content]
+    if hasattr(result, 'content'):
+        logger.debug("Result has content attribute")
+        # Handle multiple content items
+        if isinstance(result.content, list):
+            return [
+                item.text if hasattr(item, 'text') else str(item)
+                for item in result.content
+            ]
+        return str(result.content)
+    logger.debug("Result has no content attribute")
+    return str(result)
+
+def result_value(iteration_result):
+    """Python value of a tool result, used to fill "$id" references in a plan"""
+    items = iteration_result if isinstance(iteration_result, list) else [iteration_result]
+    values = []
+    for item in items:
+        try:
+            value = json.loads(item)
+        except (TypeError, json.JSONDecodeError):
+            value = item
+        if isinstance(value, dict) and handles.is_handle(value.get("handle")):
+            value = value["handle"]  # pass the handle on, not its preview
+        values.append(value)
+    return values[0] if len(values) == 1 else values
+
+def plan_references(value):
+    """Ids of earlier calls referenced as "$id" anywhere in a parameter value"""
+    if isinstance(value, list):
+        return set().union(*(plan_references(v) for v in value))
+    if isinstance(value, str) and value.startswith("$") and value[1:].isidentifier():
+        return {value[1:]}
+    return set()
+
+def resolve_references(value, values):
+    """Replace "$id" references with the results of the calls they name"""
+    if isinstance(value, list):
+        return [resolve_references(v, values) for v in value]
+    if isinstance(value, str) and value.startswith("$") and value[1:] in values:
+        return values[value[1:]]
+    return value
+
+def plan_waves(calls):
+    """Split a plan into waves of calls whose references all point to earlier waves"""
+    for index, call in enumerate(calls):
+        call.setdefault('id', str(index + 1))
+        call['id'] = str(call['id'])
+    ids = {call['id'] for call in calls}
+    pending = list(calls)
+    done = set()
+    waves = []
+    while pending:
+        ready = []
+        for call in pending:
+            depends_on = plan_references(call.get('parameters') or [])
+            if depends_on - ids:
+                raise ValueError(f"Call {call['id']} references unknown ids: {sorted(depends_on - ids)}")
+            if depends_on <= done:
+                ready.append(call)
+        if not ready:
+            raise ValueError(f"Plan has circular references between {[c['id'] for c in pending]}")
+        waves.append(ready)
+        done.update(call['id'] for call in ready)
+        pending = [call for call in pending if call['id'] not in done]
+    return waves
+
+async def execute_call(session, catalogue, func_name, params):
+    """Convert the parameters for one tool and call it; returns (arguments, result text)"""
+    # Find the matching tool to get its input schema
+    tool = catalogue.get(func_name)
+    if not tool:
+        logger.debug("Available tools: %s", list(catalogue.by_name))
+        raise ValueError(f"Unknown tool: {func_name}")
+
+    logger.debug("Found tool: %s", tool.name)
+    logger.debug("Tool schema: %s", tool.inputSchema)
+    with tracer.span("tool.convert", tool=func_name):
+        arguments = catalogue.convert(func_name, params)
+        sent = packed.pack_arguments(arguments, PACK_MIN_ITEMS) if PACK_MIN_ITEMS else arguments
+
+    logger.debug("Final parameters: %s", params)
+    logger.debug("Calling tool %s", func_name)
+    meta = tracing.trace_context()
+    if PACK_MIN_ITEMS:
+        meta["packed"] = PACK_MIN_ITEMS
+    if RESULT_HANDLE_CHARS:
+        meta["handles"] = RESULT_HANDLE_CHARS
+    with tracer.span(
+        "tool.call", tool=func_name, arguments_bytes=len(json.dumps(sent, default=str))
+    ) as span:
+        result = await session.call_tool(func_name, sent, meta=meta)
+        span["attributes"]["result_bytes"] = sum(len(getattr(item, "text", "")) for item in result.content)
+        if result.isError:
+            span["status"] = "error"
+    logger.debug("Raw result: %s", result)
+    return arguments, result_to_text(result)
+
+async def execute_plan(session, catalogue, calls):
+    """Run a list of calls, independent ones concurrently.
+    Returns (id, function_name, arguments, result text) for each call, wave by wave."""
+    values = {}
+    outcomes = []
+    for wave in plan_waves(calls):
+        logger.debug("Running wave %s", [call['id'] for call in wave])
+        results = await asyncio.gather(*(
+            execute_call(
+                session, catalogue, call.get('function_name'),
+                resolve_references(call.get('parameters') or [], values),
+            )
+            for call in wave
+        ))
+        for call, (arguments, iteration_result) in zip(wave, results):
+            values[call['id']] = result_value(iteration_result)
+            outcomes.append((call['id'], call.get('function_name'), arguments, iteration_result))
+    return outcomes
+
+# Argument converters
+# The LLM sends parameters as a positional list. For every tool a converter is compiled once
+# from its inputSchema; it coerces each value to the schema type (nested arrays, item types,
+# unions, defaults) and raises a ValueError naming the parameter on the first bad value.
+
+def _coerce_integer(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                number = None
+            if number is not None and number.is_integer():
+                return int(number)
+    raise ValueError(f"expected integer, got {value!r}")
+
+def _coerce_number(value):
+    if type(value) is float:
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"expected number, got {value!r}")
+    return float(value)
+
+def _coerce_boolean(value):
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text not in ("true", "false"):
+            raise ValueError(f"expected true or false, got {value!r}")
+        return text == "true"
+    return bool(value)
+
+def _coerce_null(value):
+    if value is None or (isinstance(value, str) and value.strip().lower() in ("null", "none", "")):
+        return None
+    raise ValueError(f"expected null, got {value!r}")
+
+def _coerce_object(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError(f"expected object, got {value!r}")
+    return value
+
+def _parse_array(value):
+    """A list from a list or from its text form: JSON, or comma-separated bare words"""
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if not isinstance(value, str):
+        raise ValueError(f"expected array, got {value!r}")
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        clean_value = value.strip().strip('[]')
+        return [x.strip() for x in clean_value.split(',')] if clean_value.strip() else []
+    if not isinstance(parsed, list):
+        raise ValueError(f"expected array, got {value!r}")
+    return parsed
 
-def reset_state():
-    """Reset all global variables to their initial state"""
-    global last_response, iteration, iteration_response
+_TYPE_CHECKS = {
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+def compile_value_converter(schema):
+    """Build a function that coerces one value to the given JSON schema"""
+    variants = schema.get("anyOf") or schema.get("oneOf")
+    if variants:
+        options = [(variant.get("type"), compile_value_converter(variant)) for variant in variants]
+
+        def convert_union(value):
+            # a value that already has one of the types is kept as is, otherwise try each in order
+            for type_name, convert in options:
+                if type_name in _TYPE_CHECKS and _TYPE_CHECKS[type_name](value):
+                    return convert(value)
+            for _, convert in options:
+                try:
+                    return convert(value)
+                except (ValueError, TypeError):
+                    continue
+            expected = " or ".join(str(type_name) for type_name, _ in options)
+            raise ValueError(f"expected {expected}, got {value!r}")
+        return convert_union
+
+    type_name = schema.get("type", "string")
+    if isinstance(type_name, list):
+        return compile_value_converter({"anyOf": [dict(schema, type=t) for t in type_name]})
+    if type_name == "integer":
+        return _coerce_integer
+    if type_name == "number":
+        return _coerce_number
+    if type_name == "boolean":
+        return _coerce_boolean
+    if type_name == "null":
+        return _coerce_null
+    if type_name == "object":
+        return _coerce_object
+    if type_name == "array":
+        items = schema.get("items") or {}
+        if not items:
+            # untyped items: keep what the text form parsed to
+            return _parse_array
+        convert_item = compile_value_converter(items)
+        item_type = {"integer": int, "number": float, "string": str}.get(items.get("type"))
+        # items that already have the right type skip the converter call
+        return lambda value: [
+            item if type(item) is item_type or handles.is_handle(item) else convert_item(item)
+            for item in _parse_array(value)
+        ]
+    # Default to string for unknown types
+    return str
+
+def compile_converter(tool):
+    """Build the function mapping a tool's positional LLM parameters onto keyword arguments"""
+    properties = tool.inputSchema.get('properties', {})
+    required = set(tool.inputSchema.get('required', []))
+    names = tuple(properties)
+    converters = tuple(compile_value_converter(info) for info in properties.values())
+    defaults = {name: info['default'] for name, info in properties.items() if 'default' in info}
+    min_params = max((i + 1 for i, name in enumerate(names) if name in required), default=0)
+
+    def convert(params):
+        if type(params) is not list:
+            params = [params]
+        arguments = {}
+        # parameters beyond the schema are ignored
+        try:
+            for name, convert_value, value in zip(names, converters, params):
+                if value is None and name in defaults:
+                    arguments[name] = defaults[name]
+                elif handles.is_handle(value):
+                    arguments[name] = value  # the server puts the value in its place
+                else:
+                    arguments[name] = convert_value(value)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid value for parameter {name} of {tool.name}: {e}") from None
+        if len(params) < min_params:
+            missing = [name for name in names[len(params):] if name in required]
+            raise ValueError(f"{tool.name} is missing required parameters: {', '.join(missing)}")
+        return arguments
+    return convert
+
+# Tool catalogue
+# The tool list, its prompt text and a name index are built once per server version and saved
+# to disk. The file is keyed by a fingerprint of the server command, script and mcp version, so
+# editing mcp-server.py invalidates it and the next run lists the tools again.
+TOOL_CATALOGUE_PATH = os.getenv("MCP_TOOL_CATALOGUE", ".tool_catalogue.json")
+
+def server_fingerprint(server_params):
+    """Hash of the server command line, the contents of any script it runs and the mcp version"""
+    digest = hashlib.sha256(importlib.metadata.version("mcp").encode())
+    for part in [server_params.command, *server_params.args]:
+        digest.update(b"\0" + part.encode())
+        if os.path.isfile(part):
+            with open(part, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def describe_tool(i, tool):
+    """One line of the system prompt's tool list"""
+    try:
+        # Get tool properties
+        params = tool.inputSchema
+        desc = getattr(tool, 'description', 'No description available')
+        name = getattr(tool, 'name', f'tool_{i}')
+
+        # Format the input schema in a more readable way
+        if 'properties' in params:
+            param_details = []
+            for param_name, param_info in params['properties'].items():
+                param_type = param_info.get('type', 'unknown')
+                param_details.append(f"{param_name}: {param_type}")
+            params_str = ', '.join(param_details)
+        else:
+            params_str = 'no parameters'
+
+        return f"{i+1}. {name}({params_str}) - {desc}"
+    except Exception as e:
+        logger.error("Error processing tool %d: %s", i, e)
+        return f"{i+1}. Error processing tool"
+
+class ToolCatalogue:
+    """Server tools indexed by name, with the prompt description precomputed"""
+
+    def __init__(self, tools, fingerprint=None):
+        self.tools = list(tools)
+        self.fingerprint = fingerprint
+        self.by_name = {tool.name: tool for tool in self.tools}
+        self.schemas = [tool.model_dump(mode="json", exclude_none=True) for tool in self.tools]
+        self.schema_hash = hashlib.sha256(json.dumps(self.schemas, sort_keys=True).encode()).hexdigest()
+        self.description = "\n".join(describe_tool(i, tool) for i, tool in enumerate(self.tools))
+        self.converters = {tool.name: compile_converter(tool) for tool in self.tools}
+        self._output_validators = {}
+
+    def __len__(self):
+        return len(self.tools)
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def convert(self, name, params):
+        """Keyword arguments for a call to tool name from the LLM's positional parameters"""
+        return self.converters[name](params)
+
+    def check_result(self, name, result):
+        """Raise RuntimeError if a result's structured content does not match the tool's
+        outputSchema, the check ClientSession.call_tool makes"""
+        tool = self.by_name.get(name)
+        if tool is None or tool.outputSchema is None:
+            return
+        if result.structuredContent is None:
+            raise RuntimeError(f"Tool {name} has an output schema but did not return structured content")
+        import jsonschema
+        validator = self._output_validators.get(name)
+        if validator is None:
+            import referencing
+            # an empty registry: $refs resolve within the schema itself, as in ClientSession
+            validator_class = jsonschema.validators.validator_for(tool.outputSchema)
+            validator = validator_class(tool.outputSchema, registry=referencing.Registry())
+            self._output_validators[name] = validator
+        error = jsonschema.exceptions.best_match(validator.iter_errors(result.structuredContent))
+        if error is not None:
+            raise RuntimeError(f"Invalid structured content returned by tool {name}: {error}")
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "schema_hash": self.schema_hash,
+                "tools": self.schemas,
+            }, f)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """Catalogue saved for this server fingerprint, or None if missing or stale"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("fingerprint") != fingerprint:
+                return None
+            catalogue = cls([types.Tool.model_validate(tool) for tool in data["tools"]], fingerprint)
+        except (OSError, ValueError, KeyError):
+            return None
+        return catalogue if catalogue.schema_hash == data.get("schema_hash") else None
+
+# Server session pool
+# Starting mcp-server.py, initializing the session and listing tools costs far more than a
+# short query. The pool keeps sessions open across queries, pings each one before handing it
+# out and replaces it after SESSION_MAX_CALLS tool calls or any error.
+SESSION_POOL_SIZE = int(os.getenv("MCP_SESSION_POOL_SIZE", "1"))
+SESSION_MAX_CALLS = int(os.getenv("MCP_SESSION_MAX_CALLS", "1000"))
+SESSION_PING_TIMEOUT = 5
+
+class PooledSession:
+    """An initialized server session owned by its own task, so the stdio transport is
+    opened and closed in the same task as anyio requires"""
+
+    def __init__(self, server_params, catalogue=None):
+        self.server_params = server_params
+        self.session = None
+        self.catalogue = catalogue
+        self.calls = 0
+        self.broken = False
+        self._error = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = None
+
+    async def open(self):
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    if self.catalogue is None:
+                        self.catalogue = ToolCatalogue((await session.list_tools()).tools)
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            self.broken = True
+        finally:
+            self._ready.set()
+
+    async def call_tool(self, name, arguments, meta=None):
+        self.calls += 1
+        try:
+            result = await self.session.send_request(
+                types.ClientRequest(types.CallToolRequest(params=types.CallToolRequestParams(
+                    name=name, arguments=arguments, _meta=types.RequestParams.Meta(**meta) if meta else None,
+                ))),
+                types.CallToolResult,
+            )
+            # checked against the catalogue's output schemas, so a session opened from the saved
+            # catalogue never lists the tools; packed and handle results have their own shape
+            if not result.isError and not skips_output_schema(result):
+                self.catalogue.check_result(name, result)
+            return result
+        except Exception:
+            # tool failures come back as results; an exception means the transport is in trouble
+            self.broken = True
+            raise
+
+    async def read_resource(self, uri):
+        return await self.session.read_resource(uri)
+
+    async def healthy(self):
+        if self.broken or self._task.done():
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), SESSION_PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+
+class ServerSessionPool:
+    """Keeps size initialized server sessions alive and lends them out one query at a time"""
+
+    def __init__(self, server_params, size=SESSION_POOL_SIZE, max_calls=SESSION_MAX_CALLS,
+                 catalogue_path=TOOL_CATALOGUE_PATH):
+        self.server_params = server_params
+        self.size = size
+        self.max_calls = max_calls
+        self.catalogue_path = catalogue_path
+        self.catalogue = None
+        self._idle = asyncio.Queue()
+        self._sessions = set()
+        self.started = 0
+        self.recycled = 0
+
+    async def _new_session(self):
+        entry = await PooledSession(self.server_params, self.catalogue).open()
+        self._sessions.add(entry)
+        self.started += 1
+        return entry
+
+    async def _replace(self, entry):
+        self._sessions.discard(entry)
+        self.recycled += 1
+        await entry.close()
+        self._idle.put_nowait(await self._new_session())
+
+    async def start(self):
+        fingerprint = server_fingerprint(self.server_params)
+        self.catalogue = ToolCatalogue.load(self.catalogue_path, fingerprint)
+        pending = self.size
+        if self.catalogue is None:
+            # the first session lists the tools; save them for this server version
+            entry = await self._new_session()
+            self.catalogue = entry.catalogue
+            self.catalogue.fingerprint = fingerprint
+            self.catalogue.save(self.catalogue_path)
+            self._idle.put_nowait(entry)
+            pending -= 1
+        else:
+            logger.info("Loaded %d tools from %s", len(self.catalogue), self.catalogue_path)
+        for entry in await asyncio.gather(*(self._new_session() for _ in range(pending))):
+            self._idle.put_nowait(entry)
+        logger.info("Session pool ready: %d server session(s)", self.size)
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """Borrow a healthy session; it is replaced afterwards if it failed or is worn out"""
+        entry = await self._idle.get()
+        while not await entry.healthy():
+            logger.warning("Pooled session failed its health check, starting a new one")
+            await self._replace(entry)
+            entry = await self._idle.get()
+        try:
+            yield entry
+        except BaseException:
+            entry.broken = True
+            raise
+        finally:
+            if entry.broken or entry.calls >= self.max_calls:
+                await self._replace(entry)
+            else:
+                self._idle.put_nowait(entry)
+
+    async def close(self):
+        await asyncio.gather(*(entry.close() for entry in self._sessions), return_exceptions=True)
+        self._sessions.clear()
+
+def build_system_prompt(catalogue):
+    """System prompt listing every tool, built once per server"""
+    # Create system prompt with available tools
+    logger.info("Creating system prompt...")
+    logger.info("Number of tools: %d", len(catalogue))
+    tools_description = catalogue.description
+
+    logger.info("Created system prompt...")
+
+    system_prompt = f"""You are a math reasoning agent solving problems in iterations. You have access to various mathematical tools.
+
+    Available tools:
+    {tools_description}
+
+    You must respond with EXACTLY ONE line in one of these formats (no additional text):
+    1. For function calls:
+    {{"function_name": "function_name", "parameters": ["param1", "param2"] }}
+
+    2. For several calls at once (a plan), as a JSON list on one line:
+    [{{"id": "a", "function_name": "function_name", "parameters": ["param1"] }}, {{"id": "b", "function_name": "function_name", "parameters": ["$a"] }}]
+
+    3. For final answers:
+    {{"function_name": "FINAL_ANSWER", "parameters": [number] }}
+
+    Examples:
+    - {{"function_name": "add", "parameters": [5, 3] }}
+    - {{"function_name": "strings_to_chars_to_int", "parameters": ["INDIA"] }}
+    - {{"function_name": "FINAL_ANSWER", "parameters": [42] }}
+    - [{{"id": "a", "function_name": "strings_to_chars_to_int", "parameters": ["INDIA"] }}, {{"id": "b", "function_name": "strings_to_chars_to_int", "parameters": ["CHINA"] }}, {{"id": "c", "function_name": "add_list", "parameters": ["$a"] }}, {{"id": "d", "function_name": "add_list", "parameters": ["$b"] }}]
+    - {{"function_name": "show_reasoning", "parameters": ["First, I need to identify the multiples of 5 between 1 and 20. These are 5, 10, 15, and 20.", "Next, I need to add these multiples together.", "Finally, I need to find the square root of the sum."] }}
+    - {{"function_name": "evaluate", "parameters": ["sqrt(5 + 10 + 15 + 20)"] }}
+    - {{"function_name": "evaluate_plan", "parameters": [[{{"id": "a", "function_name": "strings_to_chars_to_int", "parameters": ["INDIA"] }}, {{"id": "b", "function_name": "int_list_to_exponential_sum", "parameters": ["$a"] }}]] }}
+
+    Important:
+    - Run the show_reasoning tool only once in the first iteration.
+    - When a function returns multiple values, you need to process all of them.
+    - If parameters are strings, they must be enclosed in double quotes. 
+    - If parameters are arrays, they must be enclosed in single square brackets.
+    - Only give FINAL_ANSWER when you have completed all necessary calculations
+    - Do not repeat function calls with the same parameters.
+    - When several calculations do not depend on each other, send them together as a plan. A parameter "$id" is replaced by the result of the call with that id; calls without such references run at the same time.
+    - Never put show_reasoning or FINAL_ANSWER inside a plan.
+    - A large result comes back as {{"handle": "@r1a2b3c4d", "length": ..., "preview": [...]}}; the full value stays on the server. Pass the handle string as the parameter wherever that value is needed (also in FINAL_ANSWER) and never retype values from the preview.
+    - When the numbers are in a dataset on the server, call list_datasets and then the dataset_* tools with the dataset name; never copy a dataset's numbers into parameters.
+    - Prefer doing all the calculations in one call: evaluate for a single arithmetic expression, or evaluate_plan for several steps (tool calls, or expressions that use earlier step ids as variables). It returns every intermediate value, so verify the final result once and then give FINAL_ANSWER.
+    - Do not add parentheses to the function name.
+    - DO NOT include any explanations or additional text.
+    - Your entire response should be a JSON object.
+    - If user asks non-mathematical queries, you must respond with "I'm sorry, I can only help with mathematical queries."
+    - If user asks to verify the result, you must call the verify tool with the appropriate expression and expected result as the parameters.
+    - For the show_reasoning tool, in the last step of the reasoning, tag the appropriate reasoning type in one word like arithmetic, logic, etc.
+
+    Sample conversation:
+    User: Calculate sum of first two prime numbers and return the square root of the sum
+    Assistant: {{"function_name": "show_reasoning", "parameters": ["First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers. This is an arithmetic problem."]}}
+    User: In the 1 iteration you called show_reasoning with {{\'steps\': \'First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers and finally I need to find the square root of the sum. This is an arithmetic problem.\'}} parameters, and the function returned [{{"steps": "First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers and finally I need to find the square root of the sum. This is an arithmetic problem."}}]. Now proceed to do the calculations.
+    Assistant: {{"function_name": "add", "parameters": [2, 3] }}
+    User: In the 2 iteration you called add with {{'a': 2, 'b': 3}} parameters, and the function returned [5]. Let's verify the result.
+    Assistant: {{"function_name": "verify", "parameters": ["2 + 3", "5"]}}
+    User: In the 3 iteration you called verify with {{'expression': '2 + 3', 'expected': '5'}} parameters, and the function returned [True]. Verified. Next step?
+    Assistant: {{"function_name": "sqrt", "parameters": [5] }}
+    User: In the 4 iteration you called sqrt with {{'a': 5}} parameters, and the function returned [2.23606797749979]. Let's verify the result.
+    Assistant: {{"function_name": "verify", "parameters": ["sqrt(5)", "2.23606797749979"]}}
+    User: In the 5 iteration you called verify with {{'expression': 'sqrt(5)', 'expected': '2.23606797749979'}} parameters, and the function returned [True]. Verified. Next step?
+    Assistant: {{"function_name": "FINAL_ANSWER", "parameters": [2.23606797749979] }}
+
+    """
+
+    # the system prompt goes out with every request; drop the source indentation of each line
+    system_prompt = "\n".join(line.strip() for line in system_prompt.splitlines())
+    logger.info("System prompt: %d chars (~%d tokens)", len(system_prompt), estimate_tokens(system_prompt))
+    return system_prompt
+
+async def run_agent(session, catalogue, system_prompt, query):
+    """Run the iteration loop for one query on an initialized session.
+    All state is local, so several queries can run at once on different sessions."""
+    history = ConversationHistory()
     last_response = None
     iteration = 0
-    iteration_response = []
+    started = time.perf_counter()
+    llm_turns = 0
+    tool_calls = 0
+    logger.info("Starting iteration loop...")
 
-async def main():
-    reset_state()  # Reset at the start of main
-    print("Starting main execution...")
-    try:
-        # Create a single MCP server connection
-        print("Establishing connection to MCP server...")
-        server_params = StdioServerParameters(
-            command="python",
-            args=["mcp-server.py"]
+    while iteration < max_iterations:
+        logger.info("--- Iteration %d ---", iteration + 1)
+        timings.start_iteration(query)
+        with tracer.span("agent.prompt", iteration=iteration + 1) as span:
+            current_query = history.render(query)
+            prompt = f"{system_prompt}\n\nQuery: {current_query}"
+            span["attributes"]["prompt_chars"] = len(prompt)
+
+        # Get model's response with timeout
+        logger.info("Preparing to generate LLM response...")
+        logger.info(
+            "Prompt size: %d chars (~%d tokens), history %d turns (~%d tokens, %d omitted)",
+            len(prompt), estimate_tokens(prompt), len(history), history.tokens, history.omitted,
         )
+        try:
+            with tracer.span("llm.generate", model=LLM_MODEL, iteration=iteration + 1) as span:
+                response = await generate_with_timeout(client, prompt)
+                span["attributes"]["response_chars"] = len(response.text or "")
+            llm_turns += 1
+            with tracer.span("llm.extract"):
+                # keep only the JSON call, even if the model wrapped it in a code fence
+                response_text = first_json_value(response.text.strip())
+            logger.info("LLM response: %s", response_text)
 
-        async with stdio_client(server_params) as (read, write):
-            print("Connection established, creating session...")
-            async with ClientSession(read, write) as session:
-                print("Session created, initializing...")
-                await session.initialize()
-                
-                # Get available tools
-                print("Requesting tool list...")
-                tools_result = await session.list_tools()
-                tools = tools_result.tools
-                print(f"Successfully retrieved {len(tools)} tools")
-
-                # Create system prompt with available tools
-                print("Creating system prompt...")
-                print(f"Number of tools: {len(tools)}")
-                
-                try:
-                    # First, let's inspect what a tool object looks like
-                    # if tools:
-                    #     print(f"First tool properties: {dir(tools[0])}")
-                    #     print(f"First tool example: {tools[0]}")
-                    
-                    tools_description = []
-                    for i, tool in enumerate(tools):
-                        try:
-                            # Get tool properties
-                            params = tool.inputSchema
-                            desc = getattr(tool, 'description', 'No description available')
-                            name = getattr(tool, 'name', f'tool_{i}')
-                            
-                            # Format the input schema in a more readable way
-                            if 'properties' in params:
-                                param_details = []
-                                for param_name, param_info in params['properties'].items():
-                                    param_type = param_info.get('type', 'unknown')
-                                    param_details.append(f"{param_name}: {param_type}")
-                                params_str = ', '.join(param_details)
-                            else:
-                                params_str = 'no parameters'
-
-                            tool_desc = f"{i+1}. {name}({params_str}) - {desc}"
-                            tools_description.append(tool_desc)
-                            print(f"{tool_desc}")
-                        except Exception as e:
-                            print(f"Error processing tool {i}: {e}")
-                            tools_description.append(f"{i+1}. Error processing tool")
-                    
-                    tools_description = "\n".join(tools_description)
-                    print("Successfully created tools description")
-                except Exception as e:
-                    print(f"Error creating tools description: {e}")
-                    tools_description = "Error loading tools"
-                
-                print("Created system prompt...")
-                
-                system_prompt = f"""You are a math reasoning agent solving problems in iterations. You have access to various mathematical tools.
-
-                Available tools:
-                {tools_description}
-
-                You must respond with EXACTLY ONE line in one of these formats (no additional text):
-                1. For function calls:
-                {{"function_name": "function_name", "parameters": ["param1", "param2"] }}
-                
-                2. For final answers:
-                {{"function_name": "FINAL_ANSWER", "parameters": [number] }}
-
-                Examples:
-                - {{"function_name": "add", "parameters": [5, 3] }}
-                - {{"function_name": "strings_to_chars_to_int", "parameters": ["INDIA"] }}
-                - {{"function_name": "FINAL_ANSWER", "parameters": [42] }}
-                - {{"function_name": "show_reasoning", "parameters": ["First, I need to identify the multiples of 5 between 1 and 20. These are 5, 10, 15, and 20.", "Next, I need to add these multiples together.", "Finally, I need to find the square root of the sum."] }}
-
-                Important:
-                - Run the show_reasoning tool only once in the first iteration.
-                - When a function returns multiple values, you need to process all of them.
-                - If parameters are strings, they must be enclosed in double quotes. 
-                - If parameters are arrays, they must be enclosed in single square brackets.
-                - Only give FINAL_ANSWER when you have completed all necessary calculations
-                - Do not repeat function calls with the same parameters.
-                - Do not add parentheses to the function name.
-                - DO NOT include any explanations or additional text.
-                - Your entire response should be a JSON object.
-                - If user asks non-mathematical queries, you must respond with "I'm sorry, I can only help with mathematical queries."
-                - If user asks to verify the result, you must call the verify tool with the appropriate expression and expected result as the parameters.
-                - For the show_reasoning tool, in the last step of the reasoning, tag the appropriate reasoning type in one word like arithmetic, logic, etc.
-
-                Sample conversation:
-                User: Calculate sum of first two prime numbers and return the square root of the sum
-                Assistant: {{"function_name": "show_reasoning", "parameters": ["First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers. This is an arithmetic problem."]}}
-                User: In the 1 iteration you called show_reasoning with {{\'steps\': \'First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers and finally I need to find the square root of the sum. This is an arithmetic problem.\'}} parameters, and the function returned [{{"steps": "First, I need to identify the first two prime numbers. The first two prime numbers are 2 and 3. Then, I need to add these two numbers and finally I need to find the square root of the sum. This is an arithmetic problem."}}]. Now proceed to do the calculations.
-                Assistant: {{"function_name": "add", "parameters": [2, 3] }}
-                User: In the 2 iteration you called add with {{'a': 2, 'b': 3}} parameters, and the function returned [5]. Let's verify the result.
-                Assistant: {{"function_name": "verify", "parameters": ["2 + 3", "5"]}}
-                User: In the 3 iteration you called verify with {{'expression': '2 + 3', 'expected': '5'}} parameters, and the function returned [True]. Verified. Next step?
-                Assistant: {{"function_name": "sqrt", "parameters": [5] }}
-                User: In the 4 iteration you called sqrt with {{'a': 5}} parameters, and the function returned [2.23606797749979]. Let's verify the result.
-                Assistant: {{"function_name": "verify", "parameters": ["sqrt(5)", "2.23606797749979"]}}
-                User: In the 5 iteration you called verify with {{'expression': 'sqrt(5)', 'expected': '2.23606797749979'}} parameters, and the function returned [True]. Verified. Next step?
-                Assistant: {{"function_name": "FINAL_ANSWER", "parameters": [2.23606797749979] }}
-
-                """
-
-                #query = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. """
-
-                # Get query from command line arguments or use default
-                default_query = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. """
-                query = """ """
-                query = " ".join(sys.argv[1:]) if len(sys.argv) > 1 else default_query
-                
-                print("Starting iteration loop...")
-                
-                # Use global iteration variables
-                global iteration, last_response
-                
-                while iteration < max_iterations:
-                    print(f"\n--- Iteration {iteration + 1} ---")
-                    if last_response is None:
-                        current_query = query
+            # # Find the FUNCTION_CALL line in the response
+            # for line in response_text.split('\n'):
+            #     line = line.strip()
+            #     if line.startswith("FUNCTION_CALL:"):
+            #         response_text = line
+            #         break
+
+        except Exception as e:
+            logger.error("Failed to get LLM response: %s", e)
+            timings.end_iteration()
+            break
+
+
+        # if response_text.startswith("FUNCTION_CALL:"): 
+        #     _, function_info = response_text.split(":", 1)
+        #     parts = [p.strip() for p in function_info.split("|")]
+        #     func_name, params = parts[0], parts[1:]
+
+        #     print(f"\nDEBUG: Raw function info: {function_info}")
+        #     print(f"DEBUG: Split parts: {parts}")
+        #     print(f"DEBUG: Function name: {func_name}")
+        #     print(f"DEBUG: Raw parameters: {params}")
+
+        # Parse the JSON response
+        with tracer.span("llm.parse", response_chars=len(response_text)) as span:
+            try:
+                response_json = json.loads(response_text)
+                logger.debug("Parsed JSON: %s", response_json)
+            except json.JSONDecodeError:
+                logger.warning("Error parsing JSON response")
+                span["status"] = "error"
+                response_json = None
+
+            # A list is a plan of several calls; a single object is one call
+            if isinstance(response_json, list):
+                calls = response_json
+            elif isinstance(response_json, dict):
+                calls = [response_json]
+            else:
+                calls = []
+        func_name = calls[0].get('function_name') if len(calls) == 1 else None
+        params = calls[0].get('parameters') if len(calls) == 1 else None
+        logger.debug("Function name: %s", func_name)
+        logger.debug("Parameters: %s", params)
+
+        if func_name == "FINAL_ANSWER" and params:
+            params = await expand_handles(session, params)
+            logger.info("Iteration timings: %s", timings.format(timings.end_iteration()))
+            logger.info("Final answer: %s", params)
+            logger.info("=== Agent Execution Complete ===")
+            break
+
+        if len(calls) > 1 or (func_name and params):
+            try:
+                logger.debug("Running %d call(s)", len(calls))
+                outcomes = await execute_plan(session, catalogue, calls)
+                tool_calls += len(outcomes)
+
+                for call_id, func_name, arguments, iteration_result in outcomes:
+                    logger.debug("Final iteration result: %s", iteration_result)
+
+                    # Format the response based on result type
+                    if isinstance(iteration_result, list):
+                        result_str = f"[{', '.join(iteration_result)}]"
+                    else:
+                        result_str = str(iteration_result)
+
+                    called = f"{func_name} (id {call_id})" if len(calls) > 1 else func_name
+                    if func_name == "show_reasoning":
+                        history.append(
+                            f"User: In the {iteration + 1} iteration you called {called} with {arguments} parameters, "
+                            f"and the function returned {result_str}. Now proceed to do the calculations."
+                        )
+                    elif func_name == "verify":
+                        history.append(
+                            f"User: In the {iteration + 1} iteration you called {called} with {arguments} parameters, "
+                            f"and the function returned {result_str}. Verified. Next step?"
+                        )
                     else:
-                        current_query = current_query + "\n\n" + " ".join(iteration_response)
-                        current_query = current_query + "  What should I do next?"
-
-                    # Get model's response with timeout
-                    print("Preparing to generate LLM response...")
-                    prompt = f"{system_prompt}\n\nQuery: {current_query}"
-                    try:
-                        response = await generate_with_timeout(client, prompt)
-                        response_text = response.text.strip()
-                        print(f"{response_text}")
-                        
-                        # # Find the FUNCTION_CALL line in the response
-                        # for line in response_text.split('\n'):
-                        #     line = line.strip()
-                        #     if line.startswith("FUNCTION_CALL:"):
-                        #         response_text = line
-                        #         break
-                        
-                    except Exception as e:
-                        print(f"Failed to get LLM response: {e}")
-                        break
-
-
-                    # if response_text.startswith("FUNCTION_CALL:"): 
-                    #     _, function_info = response_text.split(":", 1)
-                    #     parts = [p.strip() for p in function_info.split("|")]
-                    #     func_name, params = parts[0], parts[1:]
-                        
-                    #     print(f"\nDEBUG: Raw function info: {function_info}")
-                    #     print(f"DEBUG: Split parts: {parts}")
-                    #     print(f"DEBUG: Function name: {func_name}")
-                    #     print(f"DEBUG: Raw parameters: {params}")
-
-                    # Parse the JSON response
-                    try:
-                        response_json = json.loads(response_text)
-                        print(f"DEBUG: Parsed JSON: {response_json}")
-                        func_name = response_json.get('function_name')
-                        print(f"DEBUG: Function name: {func_name}")
-                        params = response_json.get('parameters')
-                        print(f"DEBUG: Parameters: {params}")
-                    except json.JSONDecodeError:
-                        print("Error parsing JSON response")
-                        func_name = None
-                        params = None
-                        
-                    if func_name and params:
-                        try:
-                            # Find the matching tool to get its input schema
-                            tool = next((t for t in tools if t.name == func_name), None)
-
-                            if func_name == "FINAL_ANSWER":
-                                print("\n=== Agent Execution Complete ===")
-                                break
-
-                            if not tool:
-                                print(f"DEBUG: Available tools: {[t.name for t in tools]}")
-                                raise ValueError(f"Unknown tool: {func_name}")
-
-                            print(f"DEBUG: Found tool: {tool.name}")
-                            print(f"DEBUG: Tool schema: {tool.inputSchema}")
-
-                            # Replace the parameter conversion section with this improved version
-                            arguments = {}
-                            schema_properties = tool.inputSchema.get('properties', {})
-
-                            # Get the first property name from schema (since your format uses array of parameters)
-                            param_names = list(schema_properties.keys())
-
-                            for i, param_value in enumerate(params):
-                                if i >= len(param_names):
-                                    break  # Don't process more parameters than we have schema properties
-                                    
-                                param_name = param_names[i]
-                                param_info = schema_properties[param_name]
-                                param_type = param_info.get('type', 'string')
-                                
-                                # Convert value based on the parameter type
-                                try:
-                                    if param_type == 'integer':
-                                        arguments[param_name] = int(param_value)
-                                    elif param_type == 'number':
-                                        arguments[param_name] = float(param_value)
-                                    elif param_type == 'array':
-                                        # If the value is already a list, use it directly
-                                        if isinstance(param_value, list):
-                                            arguments[param_name] = param_value
-                                        # If it's a string representation of a list, parse it
-                                        elif isinstance(param_value, str):
-                                            # Remove brackets and split by comma
-                                            clean_value = param_value.strip('[]')
-                                            if clean_value:
-                                                # Handle array item types based on items schema if available
-                                                items_type = param_info.get('items', {}).get('type', 'string')
-                                                if items_type == 'integer':
-                                                    arguments[param_name] = [int(x.strip()) for x in clean_value.split(',')]
-                                                elif items_type == 'number':
-                                                    arguments[param_name] = [float(x.strip()) for x in clean_value.split(',')]
-                                                else:
-                                                    arguments[param_name] = [x.strip() for x in clean_value.split(',')]
-                                            else:
-                                                arguments[param_name] = []
-                                    elif param_type == 'boolean':
-                                        # Handle boolean values
-                                        if isinstance(param_value, str):
-                                            arguments[param_name] = param_value.lower() == 'true'
-                                        else:
-                                            arguments[param_name] = bool(param_value)
-                                    else:
-                                        # Default to string for unknown types
-                                        arguments[param_name] = str(param_value)
-                                except (ValueError, TypeError) as e:
-                                    print(f"Error converting parameter {param_name}: {e}")
-                                    raise ValueError(f"Invalid value for parameter {param_name}: {param_value}")
-
-
-
-                            print(f"DEBUG: Final parameters: {params}")
-                            print(f"DEBUG: Calling tool {func_name}")
-
-                            
-                            
-                            result = await session.call_tool(func_name, arguments)
-                            print(f"DEBUG: Raw result: {result}")
-                            
-                            # Get the full result content
-                            if hasattr(result, 'content'):
-                                print(f"DEBUG: Result has content attribute")
-                                # Handle multiple content items
-                                if isinstance(result.content, list):
-                                    iteration_result = [
-                                        item.text if hasattr(item, 'text') else str(item)
-                                        for item in result.content
-                                    ]
-                                else:
-                                    iteration_result = str(result.content)
-                            else:
-                                print(f"DEBUG: Result has no content attribute")
-                                iteration_result = str(result)
-                                
-                            print(f"DEBUG: Final iteration result: {iteration_result}")
-                            
-                            # Format the response based on result type
-                            if isinstance(iteration_result, list):
-                                result_str = f"[{', '.join(iteration_result)}]"
-                            else:
-                                result_str = str(iteration_result)
-                            
-                            if func_name == "show_reasoning":
-                                iteration_response.append(
-                                    f"User: In the {iteration + 1} iteration you called {func_name} with {arguments} parameters, "
-                                    f"and the function returned {result_str}. Now proceed to do the calculations."
-                                )
-                            elif func_name == "verify":
-                                iteration_response.append(
-                                    f"User: In the {iteration + 1} iteration you called {func_name} with {arguments} parameters, "
-                                    f"and the function returned {result_str}. Verified. Next step?"
-                                )
-                            else:
-                                iteration_response.append(
-                                    f"User: In the {iteration + 1} iteration you called {func_name} with {arguments} parameters, "
-                                    f"and the function returned {result_str}. Let's verify the result."
-                                )
-
-                            print(f"Iteration_response: {iteration_response}")
-                            last_response = iteration_result
-
-                            print(f"Iteration_result: {iteration_result}")
-
-                        except Exception as e:
-                            print(f"DEBUG: Error details: {str(e)}")
-                            print(f"DEBUG: Error type: {type(e)}")
-                            import traceback
-                            traceback.print_exc()
-                            iteration_response.append(f"Error in iteration {iteration + 1}: {str(e)}")
-                            break
-
-                    # elif response_text.startswith("FINAL_ANSWER:"):
-                    #     print("\n=== Agent Execution Complete ===")
-                        # break
-
-
-
-                        #result = await session.call_tool("open_paint")
-                        #result = await session.call_tool("mac_open_keynote")
-                        #print(result.content[0].text)
-
-                        # Wait longer for Paint to be fully maximized
-                        #await asyncio.sleep(1)
-
-                        # Draw a rectangle
-                        # result = await session.call_tool(
-                        #     "mac_draw_rectangle",
-                        #     arguments={
-                        #         "x1": 780,
-                        #         "y1": 380,
-                        #         "x2": 1140,
-                        #         "y2": 700
-                        #     }
-                        # )
-                        # print(result.content[0].text)
-
-                        # Draw rectangle and add text
-                        # result = await session.call_tool(
-                        #     "mac_add_text_in_keynote",
-                        #     arguments={
-                        #         "text": response_text
-                        #     }
-                        # )
-                        # print(result.content[0].text)
-                        # break
-
-                    iteration += 1
+                        history.append(
+                            f"User: In the {iteration + 1} iteration you called {called} with {arguments} parameters, "
+                            f"and the function returned {result_str}. Let's verify the result."
+                        )
+                    last_response = iteration_result
+
+                logger.debug("History: %s", history.turns)
+                logger.debug("Iteration_result: %s", last_response)
+
+            except Exception as e:
+                logger.exception("Tool call failed: %s", e)
+                history.append(f"Error in iteration {iteration + 1}: {str(e)}")
+                timings.end_iteration()
+                break
+
+        # elif response_text.startswith("FINAL_ANSWER:"):
+        #     print("\n=== Agent Execution Complete ===")
+            # break
+
+
+
+            #result = await session.call_tool("open_paint")
+            #result = await session.call_tool("mac_open_keynote")
+            #print(result.content[0].text)
+
+            # Wait longer for Paint to be fully maximized
+            #await asyncio.sleep(1)
+
+            # Draw a rectangle
+            # result = await session.call_tool(
+            #     "mac_draw_rectangle",
+            #     arguments={
+            #         "x1": 780,
+            #         "y1": 380,
+            #         "x2": 1140,
+            #         "y2": 700
+            #     }
+            # )
+            # print(result.content[0].text)
+
+            # Draw rectangle and add text
+            # result = await session.call_tool(
+            #     "mac_add_text_in_keynote",
+            #     arguments={
+            #         "text": response_text
+            #     }
+            # )
+            # print(result.content[0].text)
+            # break
+
+        logger.info("Iteration timings: %s", timings.format(timings.end_iteration()))
+        iteration += 1
+
+    logger.info("Finished in %.2fs: %d LLM turns, %d tool calls", time.perf_counter() - started, llm_turns, tool_calls)
+    if llm_cache is not None:
+        logger.info("LLM cache: %s", llm_cache.stats())
+
+async def main():
+    logger.info("Starting main execution...")
+    # Get queries from the command line (or a file with one query per line) or use the default
+    default_query = """Find the ASCII values of characters in INDIA and then return sum of exponentials of those values. """
+    if len(sys.argv) > 2 and sys.argv[1] == "--queries":
+        with open(sys.argv[2]) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = [" ".join(sys.argv[1:]) if len(sys.argv) > 1 else default_query]
+
+    # the stdio client only passes a few safe variables to the server; add the server's own settings
+    server_env = get_default_environment() | {
+        key: value for key, value in os.environ.items() if key.startswith("CALCULATOR_")
+    }
+    server_params = StdioServerParameters(
+        command="python",
+        args=["mcp-server.py"],
+        env=server_env,
+    )
+    pool = ServerSessionPool(server_params)
+
+    async def run_query(query):
+        # each query waits for a free session, so at most MCP_SESSION_POOL_SIZE run at once
+        try:
+            async with pool.session() as session:
+                with tracer.span("agent.query", query_chars=len(query)):
+                    await run_agent(session, pool.catalogue, system_prompt, query)
+        except Exception as e:
+            logger.exception("Query %r failed: %s", query, e)
+
+    try:
+        logger.info("Establishing connection to MCP server...")
+        await pool.start()
+        system_prompt = build_system_prompt(pool.catalogue)
+        await asyncio.gather(*(run_query(query) for query in queries))
 
     except Exception as e:
-        print(f"Error in main execution: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in main execution: %s", e)
     finally:
-        reset_state()  # Reset at the end of main
+        await pool.close()
+        if METRICS_PATH:
+            tracer.write_prometheus(METRICS_PATH)
+        tracer.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
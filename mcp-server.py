@@ -1,21 +1,43 @@
 # basic import 
+import ast
+import asyncio
+import contextvars
+import decimal
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from mcp.server.fastmcp import FastMCP, Image
+from mcp.server.fastmcp.exceptions import ToolError
 from mcp.server.fastmcp.prompts import base
-from mcp.types import TextContent
-from mcp import types
+from mcp.types import CallToolResult, TextContent
 # from PIL import Image as PILImage
 import math
 import sys
 import time
-from typing import List
+
+import handles
+import logs
+import packed
+import tracing
+
+# Startup only does what the protocol handshake needs (see benchmarks/startup.py). numpy, the
+# one heavy import of our own (~60 ms), is imported inside the tools that use it. rich and
+# multiprocessing are already loaded by mcp.server.fastmcp; what waits for first use there is the
+# console, the render thread and spawning the process pool's workers.
 
 # from pywinauto.application import Application
 # import win32gui
 # import win32con
 # from win32api import GetSystemMetrics
 
-import subprocess
-import platform
+# import subprocess
+# import platform
 
 #win32gui / win32con	pyobjc (AppKit, Quartz)
 #win32api	osascript,
@@ -25,13 +47,625 @@ import platform
 #import pyautogui
 #import psutil
 
-from rich.console import Console
-from rich.panel import Panel
+# LOGGING
+# Under the stdio transport stdout carries the JSON-RPC frames, so nothing may print to it. Logs
+# go through a queue to stderr (or CALCULATOR_LOG_FILE) and the recent ones are served at the
+# logs://recent resource. The default level keeps the per-call debug lines off the hot path.
+
+LOG_LEVEL = os.getenv("CALCULATOR_LOG_LEVEL", "WARNING").upper()
+logger, log_buffer = logs.setup_logging(
+    "calculator",
+    LOG_LEVEL,
+    os.getenv("CALCULATOR_LOG_FILE"),
+    int(os.getenv("CALCULATOR_LOG_BUFFER", "1000")),
+)
+
+@functools.cache
+def get_console():
+    """rich Console for the reasoning and verify panels, created on first use.
+    It writes to stderr; stdout belongs to the protocol."""
+    from rich.console import Console
+    return Console(stderr=True)
+
+# RENDERING
+# The reasoning and verify panels are only for someone watching the server's terminal.
+# CALCULATOR_RENDER picks how they are drawn: "interactive" inside the tool call, "deferred" on a
+# background thread after the call has returned, or "headless" not at all. The default "auto" is
+# interactive when stderr is a terminal and headless otherwise, so batch runs never render.
+
+RENDER_MODES = ("interactive", "deferred", "headless")
+RENDER_MODE = os.getenv("CALCULATOR_RENDER", "auto")
+if RENDER_MODE == "auto":
+    RENDER_MODE = "interactive" if sys.stderr.isatty() else "headless"
+if RENDER_MODE not in RENDER_MODES:
+    raise ValueError(f"CALCULATOR_RENDER must be auto or one of {', '.join(RENDER_MODES)}, got {RENDER_MODE!r}")
+
+
+def _render_worker(jobs):
+    while True:
+        job = jobs.get()
+        try:
+            job(get_console())
+        except Exception:
+            logger.exception("Rendering failed")
+        finally:
+            jobs.task_done()
+
+
+@functools.cache
+def get_render_queue():
+    """Queue of the deferred render thread, started on first use"""
+    import atexit
+    import queue
+    jobs = queue.Queue()
+    threading.Thread(target=_render_worker, args=(jobs,), name="render", daemon=True).start()
+    atexit.register(jobs.join)  # draw what is still queued before the process exits
+    return jobs
+
+
+def render(job):
+    """Run job(console) as RENDER_MODE says: now, on the render thread, or not at all"""
+    if RENDER_MODE == "interactive":
+        job(get_console())
+    elif RENDER_MODE == "deferred":
+        get_render_queue().put(job)
+
+# TRACING
+# Each tools/call is a span (see tracing.py) that joins the client's trace through the ids the
+# client sends in the request _meta. CALCULATOR_TRACE_FILE receives the spans as JSON lines and
+# the metrics://prometheus resource serves a snapshot of their metrics.
+
+TRACE_PATH = os.getenv("CALCULATOR_TRACE_FILE")
+tracer = tracing.Tracer("server", TRACE_PATH)
+
+
+def _content_bytes(result):
+    """Size of a call_tool result as it goes back to the client"""
+    if isinstance(result, CallToolResult):
+        result = result.content
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, dict):
+        return len(json.dumps(result, default=str))
+    return sum(len(getattr(item, "text", "")) for item in result)
+
+# PACKED TRANSPORT
+# Large numeric arrays can travel as one base64 object instead of a JSON list (see packed.py).
+# Packed arguments are accepted from any client. Array results are only packed for clients that
+# ask for it with "packed": <min items> in the request _meta, since others expect plain JSON.
+# Argument validation would copy a packed argument into a list of Python numbers, so the NumPy
+# tools in ARRAY_PARAMETERS get the unpacked memoryview itself; every other argument is validated.
+
+ARRAY_PARAMETERS = {
+    "batch_compute": ("a", "b"),
+    "int_list_to_exponential_sum": ("int_list",),
+}
+
+
+def pack_result(result, min_items):
+    """A CallToolResult holding result as one packed array, or None to send it as usual"""
+    if not isinstance(result, (list, tuple)) and not hasattr(result, "dtype"):
+        return None
+    payload = packed.pack(result, min_items)
+    if payload is None:
+        return None
+    return CallToolResult(content=[TextContent(type="text", text=json.dumps(payload))], _meta={"packed": True})
+
+
+def array_arguments(name, arguments):
+    """The unpacked arguments that tool name takes without validation"""
+    return {
+        key: arguments[key] for key in ARRAY_PARAMETERS.get(name, ())
+        if isinstance(arguments.get(key), memoryview)
+    }
+
+
+async def run_with_arrays(tool, arguments, arrays):
+    """Tool.run with arrays passed to the function as they are and the other arguments validated"""
+    try:
+        return await tool.fn_metadata.call_fn_with_arg_validation(
+            tool.fn, tool.is_async, {**arguments, **dict.fromkeys(arrays, [])}, arrays
+        )
+    except Exception as e:
+        raise ToolError(f"Error executing tool {tool.name}: {e}") from e
+
+# CONCURRENCY
+# The MCP session runs every tools/call as its own task, but a sync tool executing on the event
+# loop still blocks all of them. Sync tools therefore run on a bounded thread pool, and each
+# session may have at most SESSION_CONCURRENCY calls in flight.
+
+THREAD_POOL_WORKERS = int(os.getenv("CALCULATOR_THREAD_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+SESSION_CONCURRENCY = int(os.getenv("CALCULATOR_SESSION_CONCURRENCY", "16"))
+
+_thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="tool")
+
+
+def run_in_thread_pool(fn):
+    """Wrap a sync tool in a coroutine that runs it on the shared thread pool"""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await loop.run_in_executor(_thread_pool, call)
+    return wrapper
+
+
+class ConcurrentFastMCP(FastMCP):
+    """FastMCP that keeps sync tools off the event loop and limits in-flight calls per session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_limits = weakref.WeakKeyDictionary()
+        self._warmed_up = False
+
+    def add_tool(self, fn, *args, **kwargs):
+        if not inspect.iscoroutinefunction(fn):
+            fn = run_in_thread_pool(fn)
+        super().add_tool(fn, *args, **kwargs)
+
+    async def call_tool(self, name, arguments):
+        try:
+            context = self._mcp_server.request_context
+        except LookupError:
+            return await super().call_tool(name, resolve_handles(name, packed.unpack_arguments(arguments)))
+        session = context.session
+        limit = self._session_limits.get(session)
+        if limit is None:
+            limit = self._session_limits[session] = asyncio.Semaphore(SESSION_CONCURRENCY)
+        ids = (context.meta.model_extra or {}) if context.meta is not None else {}
+        with tracer.span(
+            f"tool.{name}", trace_id=ids.get("trace_id"), parent_id=ids.get("parent_id"),
+            request_id=context.request_id, arguments_bytes=len(json.dumps(arguments, default=str)),
+        ) as span:
+            queued = time.perf_counter()
+            arguments = resolve_handles(name, packed.unpack_arguments(arguments))
+            async with limit:
+                span["attributes"]["queue_ms"] = (time.perf_counter() - queued) * 1000
+                if ids.get("packed") or ids.get("handles") or array_arguments(name, arguments):
+                    result = await self._call_tool_raw(name, arguments, ids)
+                else:
+                    result = await super().call_tool(name, arguments)
+            span["attributes"]["result_bytes"] = _content_bytes(result)
+        if not self._warmed_up:
+            # start pool workers once the handshake is done so they don't slow it down
+            self._warmed_up = True
+            if PROCESS_POOL_WORKERS > 0:
+                threading.Thread(target=warm_process_pool, daemon=True).start()
+        return result
+
+    async def _call_tool_raw(self, name, arguments, ids):
+        """call_tool for a client that accepts result handles or packed results, or a call
+        with array arguments"""
+        arrays = array_arguments(name, arguments)
+        if arrays:
+            result = await run_with_arrays(self._tool_manager.get_tool(name), arguments, arrays)
+        else:
+            result = await self._tool_manager.call_tool(
+                name, arguments, context=self.get_context(), convert_result=False
+            )
+        if ids.get("handles") and name not in HANDLE_EXCLUDED_TOOLS:
+            handled = handle_result(result, int(ids["handles"]))
+            if handled is not None:
+                return handled
+        if ids.get("packed"):
+            packed_result = pack_result(result, int(ids["packed"]))
+            if packed_result is not None:
+                return packed_result
+        return self._tool_manager.get_tool(name).fn_metadata.convert_result(result)
 
-console = Console()
 
 # instantiate an MCP server client
-mcp = FastMCP("Calculator")
+mcp = ConcurrentFastMCP("Calculator", log_level=LOG_LEVEL)
+
+# RESULT CACHE
+# Pure tools (same arguments -> same result) share one bounded cache across all sessions.
+# Identical calls that arrive while the first one is still computing wait for its result
+# instead of recomputing it (single-flight).
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("CALCULATOR_CACHE_ENTRIES", "4096"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("CALCULATOR_CACHE_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv("CALCULATOR_CACHE_TTL", "3600"))
+
+
+def _freeze(value):
+    """Turn lists and dicts into hashable tuples so arguments can be used as a cache key"""
+    if isinstance(value, (list, tuple)):
+        frozen = tuple(value)
+        try:
+            # flat lists of numbers and strings are hashable as they are; hashing runs in C
+            hash(frozen)
+            return frozen
+        except (TypeError, ValueError):
+            # ValueError: memoryviews of non-byte formats refuse to hash
+            return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, memoryview):
+        # an unpacked array argument: compare and hash its bytes
+        return (value.format, value.shape, value.cast("B"))
+    return value
+
+
+def _result_size(value):
+    """Approximate memory footprint of a tool result or cache key in bytes"""
+    if isinstance(value, memoryview):
+        return sys.getsizeof(value) + value.nbytes
+    if isinstance(value, int):
+        return 28 + value.bit_length() // 8
+    if isinstance(value, (list, tuple)):
+        if set(map(type, value)) <= {int, float, str, bool}:
+            # flat lists: size every element in C
+            return 56 + 8 * len(value) + sum(map(sys.getsizeof, value))
+        return 56 + 8 * len(value) + sum(_result_size(v) for v in value)
+    if isinstance(value, dict):
+        return 64 + sum(_result_size(k) + _result_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU cache bounded by entry count and total bytes, with a TTL and single-flight"""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._inflight = {}  # key -> Future of the call computing it
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def _store(self, key, value, size=None):
+        # the frozen arguments in the key can be as large as the result, e.g. a long list
+        size = _result_size(key) + _result_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _claim(self, key):
+        """Return (True, value) on a hit, else (leader, future) for the call computing key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[0]
+                self._drop(key)
+                self.expirations += 1
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+                return False, (True, future)
+            self.merged += 1
+            return False, (False, future)
+
+    def _settle(self, key, future, value=None, error=None):
+        with self._lock:
+            if error is None:
+                self._store(key, value)
+            del self._inflight[key]
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing it at most once across concurrent callers"""
+        hit, claim = self._claim(key)
+        if hit:
+            return claim
+        leader, future = claim
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, value)
+        return value
+
+    async def get_or_compute_async(self, key, compute):
+        """get_or_compute for coroutine tools; waiting callers do not block the event loop"""
+        hit, claim = self._claim(key)
+        if hit:
+            return claim
+        leader, future = claim
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.merged
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "merged_inflight": self.merged,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.merged) / lookups if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
+
+def pure(fn):
+    """Mark a tool as pure so its results are served from the shared result cache.
+    Apply below @mcp.tool() so the tool keeps the original signature."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            key = (fn.__name__, _freeze(args), _freeze(kwargs))
+            return await result_cache.get_or_compute_async(key, lambda: fn(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, _freeze(args), _freeze(kwargs))
+        return result_cache.get_or_compute(key, lambda: fn(*args, **kwargs))
+    return wrapper
+
+
+@mcp.resource("cache://results")
+def get_result_cache_stats() -> str:
+    """Size and hit/miss counters of the pure tool result cache"""
+    return json.dumps(result_cache.stats())
+
+# RESULT HANDLES
+# A client that sends "handles": <max chars> in the request _meta gets every int, number string
+# (decimal or hex, as big results are encoded) or list whose JSON text would be longer than that
+# (also inside dict results) back as a handle with a size and a preview (see handles.py). Values
+# are kept in the result store, an LRU with a TTL, and any handle among the arguments of a later
+# call is replaced by its value before the tool runs.
+
+HANDLE_STORE_MAX_ENTRIES = int(os.getenv("CALCULATOR_HANDLE_ENTRIES", "1024"))
+HANDLE_STORE_MAX_BYTES = int(os.getenv("CALCULATOR_HANDLE_BYTES", str(256 * 1024 * 1024)))
+HANDLE_TTL = float(os.getenv("CALCULATOR_HANDLE_TTL", "3600"))
+HANDLE_PREVIEW_ITEMS = 5
+HANDLE_PREVIEW_DIGITS = 12
+# show_reasoning echoes the LLM's own plan, which should stay readable in the prompt
+HANDLE_EXCLUDED_TOOLS = {"show_reasoning"}
+_NUMBER_TEXT = re.compile(r"-?(?:0x[0-9a-f]+|[0-9]+)")
+
+
+class ResultStore(ResultCache):
+    """Results kept under handles, bounded and expired like the result cache"""
+
+    def put(self, value):
+        """Store value under a new handle; returns (handle, size), handle None if it does not fit"""
+        size = _result_size(value)
+        if size > self.max_bytes:
+            return None, size
+        with self._lock:
+            handle = handles.new_handle()
+            while handle in self._entries:
+                handle = handles.new_handle()
+            self._store(handle, value, size)
+        return handle, size
+
+    def get(self, handle):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._drop(handle)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                raise ValueError(f"Result handle {handle} is unknown or expired; repeat the call that returned it")
+            self._entries.move_to_end(handle)
+            self.hits += 1
+            return entry[0]
+
+    def resolve(self, value):
+        """value with every handle in it replaced by the stored result"""
+        if isinstance(value, str):
+            return self.get(value) if handles.is_handle(value) else value
+        if isinstance(value, (list, tuple)):
+            if not set(map(type, value)) & {str, list, tuple, dict}:
+                return value  # numbers only; checked in C
+            return [self.resolve(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        return value
+
+
+result_store = ResultStore(HANDLE_STORE_MAX_ENTRIES, HANDLE_STORE_MAX_BYTES, HANDLE_TTL)
+
+
+def _text_exceeds(value, limit):
+    """Whether the JSON text of value is longer than limit, without building it for long lists"""
+    if isinstance(value, int):
+        return value.bit_length() * LOG10_2 > limit
+    if isinstance(value, str):
+        return len(value) + 2 > limit
+    if len(value) * 2 > limit:
+        return True  # at least a digit and a separator per element
+    try:
+        return len(json.dumps(value, default=str)) > limit
+    except ValueError:
+        return True  # an int too long for str()
+
+
+def _preview(value):
+    if isinstance(value, (list, tuple)):
+        return [_preview(item) for item in value[:HANDLE_PREVIEW_ITEMS]]
+    if isinstance(value, dict):
+        return {key: _preview(item) for key, item in list(value.items())[:HANDLE_PREVIEW_ITEMS]}
+    if isinstance(value, int) and value.bit_length() * LOG10_2 > 2 * HANDLE_PREVIEW_DIGITS + 3:
+        value = int_to_decimal(value)
+    if isinstance(value, str) and len(value) > 2 * HANDLE_PREVIEW_DIGITS + 3:
+        return f"{value[:HANDLE_PREVIEW_DIGITS]}...{value[-HANDLE_PREVIEW_DIGITS:]}"
+    return value
+
+
+def _with_handles(value, limit, created):
+    """value with every large int, number string or list, also inside dicts, replaced by a handle
+    summary. created maps id(value) -> summary so a value that appears twice gets one handle."""
+    if isinstance(value, dict):
+        return {key: _with_handles(item, limit, created) for key, item in value.items()}
+    if not isinstance(value, (list, tuple, int, str)) or isinstance(value, bool):
+        return value
+    if not _text_exceeds(value, limit):
+        return value
+    if isinstance(value, str) and not _NUMBER_TEXT.fullmatch(value):
+        return value  # other text, such as an error report, stays readable
+    if id(value) in created:
+        return created[id(value)]
+    handle, size = result_store.put(value)
+    if handle is None:
+        return value
+    if isinstance(value, (int, str)):
+        text = value if isinstance(value, str) else int_to_decimal(value)
+        digits = text.lstrip("-")
+        kind = "hex" if digits.startswith("0x") else "int"
+        summary = {"handle": handle, "type": kind, "digits": len(digits) - 2 * (kind == "hex"), "bytes": size,
+                   "preview": f"{text[:HANDLE_PREVIEW_DIGITS]}...{text[-HANDLE_PREVIEW_DIGITS:]}"}
+    else:
+        summary = {"handle": handle, "type": "list", "length": len(value), "bytes": size,
+                   "preview": _preview(value)}
+    created[id(value)] = summary
+    return summary
+
+
+def handle_result(result, limit):
+    """A CallToolResult with the large parts of result replaced by handles, or None if there are none"""
+    created = {}
+    value = _with_handles(result, limit, created)
+    if not created:
+        return None
+    return CallToolResult(
+        content=[TextContent(type="text", text=json.dumps(value))],
+        _meta={"handles": [summary["handle"] for summary in created.values()]},
+    )
+
+
+def _fit_string_parameters(tool, arguments):
+    """Give string parameters that received another value (an earlier result) its JSON text"""
+    properties = tool.parameters.get("properties", {})
+    for key, value in arguments.items():
+        # e.g. a list passed as verify's expected value
+        if properties.get(key, {}).get("type") == "string" and not isinstance(value, str):
+            arguments[key] = json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+    return arguments
+
+
+def resolve_handles(name, arguments):
+    """Tool arguments with every handle replaced by its value"""
+    resolved = {key: result_store.resolve(value) for key, value in arguments.items()}
+    if any(resolved[key] is not arguments[key] for key in arguments):
+        tool = mcp._tool_manager.get_tool(name)
+        if tool is not None:
+            _fit_string_parameters(tool, resolved)
+    return resolved
+
+
+@mcp.resource("result://handles/{handle}")
+def get_result(handle: str) -> str:
+    """The full value behind a result handle, as JSON"""
+    if not handles.is_handle(handle):
+        raise ValueError(f"Invalid result handle {handle!r}")
+    return json.dumps(result_store.get(handle))
+
+
+@mcp.resource("store://results")
+def get_result_store_stats() -> str:
+    """Size and hit/miss counters of the result handle store"""
+    return json.dumps(result_store.stats())
+
+@mcp.resource("logs://recent")
+def get_recent_logs() -> str:
+    """The most recent server log records, oldest first"""
+    return "\n".join(log_buffer.records)
+
+@mcp.resource("metrics://prometheus")
+def get_metrics() -> str:
+    """Prometheus text snapshot of the tool call spans"""
+    return tracer.prometheus()
+
+# PROCESS POOL
+# CPU-heavy tools run in warm worker processes so one factorial(200000) does not stall every
+# other request waiting on the event loop. Light tools like add stay inline. Workers return
+# plain ints and strings, which pickle compactly; decimal conversion happens in the worker.
+
+PROCESS_POOL_WORKERS = int(os.getenv("CALCULATOR_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PROCESS_POOL_START_METHOD = os.getenv("CALCULATOR_PROCESS_START_METHOD", "spawn")
+
+_cpu_tools = {}  # name -> undecorated function, looked up again inside the worker
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _run_cpu_tool(name, args, kwargs):
+    return _cpu_tools[name](*args, **kwargs)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def get_process_pool():
+    """Return the shared process pool, creating it on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD),
+            )
+        return _process_pool
+
+
+def warm_process_pool():
+    """Start every worker up front so the first heavy call does not pay for process startup"""
+    pool = get_process_pool()
+    pids = {f.result() for f in [pool.submit(_worker_ready) for _ in range(PROCESS_POOL_WORKERS)]}
+    logger.info("Process pool ready: %d workers", len(pids))
+
+
+def cpu_bound(fn):
+    """Run a tool in the process pool instead of on the event loop.
+    Apply below @pure so results are cached in the server process."""
+    _cpu_tools[fn.__name__] = fn
+    if PROCESS_POOL_WORKERS <= 0:
+        return fn
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_process_pool(), _run_cpu_tool, fn.__name__, args, kwargs)
+    return wrapper
 
 # DEFINE TOOLS
 
@@ -40,14 +674,22 @@ mcp = FastMCP("Calculator")
 def show_reasoning(steps):  # No type hinting
     """Shows the LLM's step-by-step reasoning thought process. RUN THIS ONLY ONCE IN FIRST STEP."""
 
-    print(f"DEBUG: Steps: {steps}")
-    for i, step in enumerate(steps, 1):
-        console.print(Panel(
-            step,
-            title=f"Step {i}",
-            border_style="cyan"
-        ))
+    if isinstance(steps, str):
+        # a single step; iterating the string would give one panel per character
+        steps = [steps]
+    logger.debug("Steps: %s", steps)
+
+    def draw(console):
+        from rich.console import Group
+        from rich.panel import Panel
 
+        # one write for all steps
+        console.print(Group(*(
+            Panel(str(step), title=f"Step {i}", border_style="cyan")
+            for i, step in enumerate(steps, 1)
+        )))
+
+    render(draw)
     return {
         "steps": steps
     }
@@ -95,159 +737,991 @@ def show_reasoning(steps):  # No type hinting
 #             text=f"Error: {str(e)}"
 #         )
 
+# EXPRESSION ENGINE
+# verify() used to eval() raw strings: re-parsed on every call and able to run any Python.
+# Expressions are now parsed once, checked against a whitelist and cached as code objects.
+# Comprehensions and sequence repetition draw on one item budget per evaluation, so a short
+# expression cannot loop or allocate without bound.
+
+EXPRESSION_CACHE_SIZE = 1024
+# refuse integer powers, products and factorials whose result would need more bits than this
+MAX_POW_BITS = 1_000_000
+MAX_REPEAT_LENGTH = 100_000
+# comprehension iterations plus repeated sequence items allowed in one evaluation
+MAX_EXPRESSION_ITEMS = 1_000_000
+
+
+def _safe_pow(a, b):
+    """Power that refuses results too large to compute in reasonable time"""
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1:
+        if b * math.log2(abs(a)) > MAX_POW_BITS:
+            raise ValueError(f"Result of {a} ** {b} is too large to evaluate")
+    return a ** b
+
+
+class _ItemBudget:
+    """Items one evaluation may still iterate over or build by repetition"""
+
+    __slots__ = ("left",)
+
+    def __init__(self):
+        self.left = MAX_EXPRESSION_ITEMS
+
+    def spend(self, count):
+        self.left -= count
+        if self.left < 0:
+            raise ValueError(f"Expression iterates over or builds more than {MAX_EXPRESSION_ITEMS} items")
+
+    def iterate(self, iterable):
+        for item in iterable:
+            self.spend(1)
+            yield item
+
+    def mul(self, a, b):
+        """Multiplication that refuses huge int products and string/list repetition"""
+        if isinstance(a, int) and isinstance(b, int):
+            if a.bit_length() + b.bit_length() > MAX_POW_BITS:
+                raise ValueError("Product of integers is too large to evaluate")
+            return a * b
+        for seq, count in ((a, b), (b, a)):
+            if isinstance(seq, (str, list, tuple)) and isinstance(count, int):
+                if len(seq) * count > MAX_REPEAT_LENGTH:
+                    raise ValueError("Sequence repetition is too large to evaluate")
+                self.spend(max(len(seq) * count, 0))
+        return a * b
+
+
+def _safe_factorial(a):
+    """Factorial limited to results of at most MAX_POW_BITS bits"""
+    if isinstance(a, int) and a > 1 and math.lgamma(a + 1) / math.log(2) > MAX_POW_BITS:
+        raise ValueError(f"factorial({a}) is too large to evaluate")
+    return math.factorial(a)
+
+
+EXPRESSION_NAMES = {
+    "sqrt": math.sqrt,
+    "cbrt": math.cbrt,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "exp": math.exp,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "factorial": _safe_factorial,
+    "pow": _safe_pow,
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sum": sum,
+    "len": len,
+    "ord": ord,
+    "int": int,
+    "float": float,
+    "pi": math.pi,
+    "e": math.e,
+    "_safe_pow": _safe_pow,
+}
+_EXPRESSION_GLOBALS = {"__builtins__": {}, **EXPRESSION_NAMES}
+# bound to a fresh _ItemBudget by evaluate_expression
+_BUDGET_NAMES = frozenset({"_safe_mul", "_safe_iter"})
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Constant, ast.Name, ast.Load, ast.Store, ast.Call,
+    ast.BinOp, ast.UnaryOp, ast.Compare, ast.List, ast.Tuple,
+    ast.ListComp, ast.GeneratorExp, ast.comprehension,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+class _SafeOperators(ast.NodeTransformer):
+    """Strip `math.` prefixes, route ** and * through the guarded helpers and make every
+    comprehension iterate through the item budget"""
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == "math" and node.attr in EXPRESSION_NAMES:
+            return ast.copy_location(ast.Name(id=node.attr, ctx=ast.Load()), node)
+        raise ValueError(f"Attribute access is not allowed: {ast.unparse(node)}")
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        helper = {ast.Pow: "_safe_pow", ast.Mult: "_safe_mul"}.get(type(node.op))
+        if helper is None:
+            return node
+        call = ast.Call(func=ast.Name(id=helper, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+    def visit_comprehension(self, node):
+        self.generic_visit(node)
+        node.iter = ast.copy_location(
+            ast.Call(func=ast.Name(id="_safe_iter", ctx=ast.Load()), args=[node.iter], keywords=[]), node.iter
+        )
+        return node
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(source: str, variables: frozenset = frozenset()):
+    """Parse, validate and compile an arithmetic expression; cached by source text.
+    variables are extra names the expression may use (earlier plan steps)."""
+    tree = _SafeOperators().visit(ast.parse(source.strip(), mode="eval"))
+    bound = {
+        target.id
+        for node in ast.walk(tree) if isinstance(node, ast.comprehension)
+        for target in ast.walk(node.target) if isinstance(target, ast.Name)
+    }
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in EXPRESSION_NAMES and node.id not in _BUDGET_NAMES and node.id not in bound and node.id not in variables:
+            raise ValueError(f"Unknown name in expression: {node.id}")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise ValueError("Only plain calls to whitelisted functions are allowed")
+    return compile(ast.fix_missing_locations(tree), "<expression>", "eval")
+
+
+def _code_names(code):
+    """Global names a compiled expression reads, including inside generator expressions"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _uses_budget(code):
+    return not _BUDGET_NAMES.isdisjoint(_code_names(code))
+
+
+def evaluate_expression(source: str, variables=None):
+    """Evaluate an arithmetic expression with the whitelisted math functions (and variables)"""
+    if not variables:
+        code, namespace = compile_expression(source), _EXPRESSION_GLOBALS
+    else:
+        code, namespace = compile_expression(source, frozenset(variables)), {**_EXPRESSION_GLOBALS, **variables}
+    if _uses_budget(code):
+        budget = _ItemBudget()
+        namespace = {**namespace, "_safe_mul": budget.mul, "_safe_iter": budget.iterate}
+    return eval(code, namespace)
+
+
+@mcp.resource("cache://expressions")
+def get_expression_cache_stats() -> str:
+    """Hit/miss counters of the compiled expression cache used by verify"""
+    info = compile_expression.cache_info()
+    return json.dumps({
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    })
+
+
+# VERIFICATION ENGINE
+# Values are compared like math.isclose: |actual - expected| <= max(rel_tol * max(|actual|, |expected|),
+# abs_tol), so huge results such as exponential sums are judged relative to their size. Exact
+# ints on both sides only get abs_tol unless the caller passes rel_tol, so 2**40 is not "equal" to
+# 2**40 + 1. Lists (nested to any depth) are compared in one vectorized NumPy pass; values NumPy
+# cannot hold exactly as float64 (ints beyond 2**53, ragged lists) fall back to an element-by-element check.
+
+VERIFY_REL_TOL = float(os.getenv("CALCULATOR_VERIFY_REL_TOL", "1e-9"))
+VERIFY_ABS_TOL = float(os.getenv("CALCULATOR_VERIFY_ABS_TOL", "1e-10"))
+VERIFY_REPORT_INDICES = 5
+
+
+def parse_value(source: str):
+    """A number or (nested) list from text: JSON literals directly, anything else as an expression"""
+    try:
+        # a plain literal skips the expression compiler and its cache, which matters for long lists
+        return json.loads(source)
+    except ValueError:
+        return evaluate_expression(source)
+
+
+def _scalar_close(actual, expected, rel_tol, abs_tol):
+    if actual == expected:
+        return True
+    if rel_tol is None:
+        rel_tol = 0.0 if isinstance(actual, int) and isinstance(expected, int) else VERIFY_REL_TOL
+    if isinstance(actual, int) and isinstance(expected, int):
+        # exact ints may exceed the float range
+        from fractions import Fraction
+        return abs(actual - expected) <= max(Fraction(rel_tol) * max(abs(actual), abs(expected)), Fraction(abs_tol))
+    actual, expected = float(actual), float(expected)
+    if math.isnan(actual) and math.isnan(expected):
+        return True
+    return math.isclose(actual, expected, rel_tol=rel_tol, abs_tol=abs_tol)
+
+
+def _flatten(value, index, out):
+    """(index tuple, leaf) pairs of a nested list, depth first"""
+    if isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            _flatten(item, index + (i,), out)
+    else:
+        out.append((index, value))
+    return out
+
+
+def _shape_mismatch(actual, expected):
+    """Description of the first place where two nested lists differ in shape, or None"""
+    if isinstance(actual, (list, tuple)) != isinstance(expected, (list, tuple)):
+        return "one side is a list and the other a single value"
+    if isinstance(actual, (list, tuple)):
+        if len(actual) != len(expected):
+            return f"length mismatch: expected {len(expected)} values, got {len(actual)}"
+        for a, e in zip(actual, expected):
+            problem = _shape_mismatch(a, e)
+            if problem:
+                return problem
+    return None
+
+
+def _report(count, total, indices, max_abs, max_rel):
+    return {
+        "equal": count == 0,
+        "mismatches": count,
+        "total": total,
+        "first_indices": indices,
+        "max_abs_error": max_abs,
+        "max_rel_error": max_rel,
+    }
+
+
+def _compare_exact(actual, expected, rel_tol, abs_tol):
+    problem = _shape_mismatch(actual, expected)
+    if problem:
+        raise ValueError(problem)
+    pairs = zip(_flatten(actual, (), []), _flatten(expected, (), []))
+    bad = [(index, a, e) for (index, a), (_, e) in pairs if not _scalar_close(a, e, rel_tol, abs_tol)]
+    errors = [abs(a - e) for _, a, e in bad]
+    rel_errors = [float(err / max(abs(a), abs(e))) for err, (_, a, e) in zip(errors, bad) if max(abs(a), abs(e))]
+    total = len(_flatten(expected, (), []))
+    max_abs = max(errors, default=0)
+    return _report(
+        len(bad), total, [list(index) for index, _, _ in bad[:VERIFY_REPORT_INDICES] if index],
+        float(max_abs) if max_abs < sys.float_info.max else math.inf, max(rel_errors, default=0.0),
+    )
+
+
+def _as_float_array(value):
+    import numpy as np
+    if isinstance(value, list) and value and not isinstance(value[0], (list, tuple)):
+        try:
+            # flat lists convert faster element by element than through asarray
+            return np.fromiter(value, np.float64, len(value))
+        except (TypeError, ValueError):
+            pass
+    return np.asarray(value, dtype=np.float64)
+
+
+def _int_mask(value, shape):
+    """Which leaves of a number or (nested) list are ints: a bool when all or none are, else an array"""
+    import numpy as np
+    if not isinstance(value, (list, tuple)):
+        return isinstance(value, int)
+    leaves = value if not value or not isinstance(value[0], (list, tuple)) else [v for _, v in _flatten(value, (), [])]
+    # one pass over the types in C settles the common all-int and all-float lists
+    types = set(map(type, leaves))
+    if types <= {int, bool}:
+        return True
+    if not types & {int, bool}:
+        return False
+    return np.fromiter((isinstance(v, int) for v in leaves), bool, len(leaves)).reshape(shape)
+
+
+def compare_values(actual, expected, rel_tol=None, abs_tol=VERIFY_ABS_TOL):
+    """Compare two numbers or nested lists of numbers within tolerance.
+    rel_tol=None applies VERIFY_REL_TOL wherever a float is involved and compares int pairs exactly.
+    Returns a report: equal, mismatches, total, first_indices, max_abs_error, max_rel_error."""
+    import numpy as np
+    try:
+        a = _as_float_array(actual)
+        e = _as_float_array(expected)
+    except (OverflowError, ValueError, TypeError):
+        return _compare_exact(actual, expected, rel_tol, abs_tol)
+    if a.shape != e.shape:
+        problem = _shape_mismatch(actual, expected)
+        raise ValueError(problem or f"shape mismatch: expected {e.shape}, got {a.shape}")
+    with np.errstate(all="ignore"):
+        scale = np.maximum(np.abs(a), np.abs(e))
+    huge = scale > 2 ** 53
+    if np.any(huge) and np.any((_int_mask(actual, a.shape) | _int_mask(expected, e.shape)) & huge):
+        # float64 would round both sides to the same value
+        return _compare_exact(actual, expected, rel_tol, abs_tol)
+    if np.array_equal(a, e, equal_nan=True):
+        return _report(0, int(a.size), [], 0.0, 0.0)
+    if rel_tol is None:
+        # the types are only looked at once the values differ; float lists stop after one side
+        int_pairs = _int_mask(expected, e.shape)
+        if np.any(int_pairs):
+            int_pairs = int_pairs & _int_mask(actual, a.shape)
+        rel_tol = np.where(int_pairs, 0.0, VERIFY_REL_TOL)
+    with np.errstate(all="ignore"):
+        error = np.abs(a - e)
+        tolerance = np.maximum(scale * rel_tol, abs_tol)
+        bad = ~((error <= tolerance) | (a == e) | (np.isnan(a) & np.isnan(e)))
+        count = int(np.count_nonzero(bad))
+        if not count:
+            return _report(0, int(a.size), [], 0.0, 0.0)
+        bad_error = error[bad]
+        bad_scale = scale[bad]
+        rel = np.divide(bad_error, bad_scale, out=np.zeros_like(bad_error), where=bad_scale != 0)
+        first = np.argwhere(bad)[:VERIFY_REPORT_INDICES].tolist() if a.ndim else []
+        return _report(count, int(a.size), first, float(np.nanmax(bad_error)), float(np.nanmax(rel)))
+
+
+def format_report(report):
+    if report["equal"]:
+        return "True"
+    if report["total"] == 1 and not report["first_indices"]:
+        return f"False: off by {report['max_abs_error']:.6g} (relative {report['max_rel_error']:.3g})"
+    return (
+        f"False: {report['mismatches']} of {report['total']} values differ, first at "
+        f"{', '.join(str(index) for index in report['first_indices'])}; "
+        f"max abs error {report['max_abs_error']:.6g}, max rel error {report['max_rel_error']:.3g}"
+    )
+
+
 @mcp.tool()
-def verify(expression: str, expected: str) -> TextContent:
-    """Verify if a calculation is correct uses the python eval function. Can handle both single values and lists."""
-    console.print("[blue]FUNCTION CALL:[/blue] verify()")
-    console.print(f"[blue]Verifying:[/blue] {expression} = {expected}")
+def verify(
+    expression: str, expected: str, rel_tol: float | None = None, abs_tol: float = VERIFY_ABS_TOL
+) -> TextContent:
+    """Verify if a calculation is correct using a safe math evaluator (arithmetic operators, sqrt, cbrt, log, exp, sin, cos, tan, factorial, sum, ord, pi, e, ...). Can handle single values and (nested) lists, compared within a relative and absolute tolerance. Integers are compared exactly unless rel_tol is given."""
+    render(lambda console: console.print(
+        f"[blue]FUNCTION CALL:[/blue] verify()\n[blue]Verifying:[/blue] {expression} = {expected}"
+    ))
     try:
-        # Check if expected is a list (starts with [ and ends with ])
-        if expected.startswith('[') and expected.endswith(']'):
-            # Handle list verification
-            expected_list = eval(expected)  # Convert string to list
-            actual_list = eval(expression)  # Evaluate the expression
-            
-            if not isinstance(actual_list, list):
-                raise ValueError(f"Expression {expression} did not evaluate to a list")
-                
-            if len(actual_list) != len(expected_list):
-                raise ValueError(f"Length mismatch: expected {len(expected_list)} values, got {len(actual_list)}")
-                
-            # Check each element with a small tolerance
-            is_correct = all(
-                abs(float(actual) - float(expected)) < 1e-10
-                for actual, expected in zip(actual_list, expected_list)
-            )
-            
-            if is_correct:
-                console.print(f"[green]✓ Correct! {expression} = {expected}[/green]")
-            else:
-                console.print(f"[red]✗ Incorrect! {expression} should be {actual_list}, got {expected_list}[/red]")
+        report = compare_values(parse_value(expression), parse_value(expected), rel_tol, abs_tol)
+        text = format_report(report)
+        if report["equal"]:
+            render(lambda console: console.print(f"[green]✓ Correct! {expression} = {expected}[/green]"))
         else:
-            # Handle single value verification (original behavior)
-            actual = float(eval(expression))
-            is_correct = abs(actual - float(expected)) < 1e-10
-            
-            if is_correct:
-                console.print(f"[green]✓ Correct! {expression} = {expected}[/green]")
-            else:
-                console.print(f"[red]✗ Incorrect! {expression} should be {actual}, got {expected}[/red]")
-            
+            render(lambda console: console.print(f"[red]✗ Incorrect! {expression} = {expected}: {text}[/red]"))
         return TextContent(
             type="text",
-            text=str(is_correct)
+            text=text
         )
     except Exception as e:
-        console.print(f"[red]Error:[/red] {str(e)}")
+        message = str(e)  # e is unbound once the except block ends, before a deferred render runs
+        render(lambda console: console.print(f"[red]Error:[/red] {message}"))
         return TextContent(
             type="text",
-            text=f"Error: {str(e)}"
+            text=f"Error: {message}"
         )
 
+# PLAN EVALUATION
+# Instead of one LLM turn per arithmetic step, the agent can send a whole expression or a small
+# DAG of steps. Steps call the other tools (or evaluate an expression over earlier steps) and run
+# here in one request, independent steps concurrently; every intermediate value comes back.
+
+MAX_PLAN_STEPS = 64
+PLAN_EXCLUDED_TOOLS = {"show_reasoning", "evaluate_plan"}
+# tools whose result can change for the same arguments; a plan that calls one is not cached
+PLAN_UNCACHED_TOOLS = set()
+
+
+@mcp.tool()
+@pure
+def evaluate(expression: str) -> int | float | str | list:
+    """Evaluate a whole arithmetic expression in one call, e.g. "sqrt(2 + 3)" or "sum([exp(i) for i in [73, 78]])". Same functions as verify.
+    Integers too long for JSON come back as exact decimal strings."""
+    logger.debug("CALLED: evaluate(expression: str) -> int | float | str | list:")
+    return _exact_json(evaluate_expression(expression))
+
+
+def _plan_references(value):
+    """Step ids referenced as "$id" anywhere in a parameter value"""
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_plan_references(v) for v in value))
+    if isinstance(value, dict):
+        return set().union(*(_plan_references(v) for v in value.values()))
+    if isinstance(value, str) and value.startswith("$") and value[1:].isidentifier():
+        return {value[1:]}
+    return set()
+
+
+def _resolve_references(value, values):
+    if isinstance(value, (list, tuple)):
+        return [_resolve_references(v, values) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve_references(v, values) for k, v in value.items()}
+    if isinstance(value, str) and value.startswith("$") and value[1:] in values:
+        return values[value[1:]]
+    return value
+
+
+def _check_plan(steps):
+    """Validate the steps; returns their ids and the ids grouped in waves whose dependencies ran earlier"""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("steps must be a non-empty list")
+    if len(steps) > MAX_PLAN_STEPS:
+        raise ValueError(f"A plan may have at most {MAX_PLAN_STEPS} steps, got {len(steps)}")
+    if not all(isinstance(step, dict) for step in steps):
+        raise ValueError("Every step must be an object")
+    ids = [str(step.get("id", f"s{index + 1}")) for index, step in enumerate(steps)]
+    for step_id in ids:
+        if not step_id.isidentifier() or step_id in EXPRESSION_NAMES or ids.count(step_id) > 1:
+            raise ValueError(f"Step id {step_id!r} must be a unique identifier that is not a function name")
+    known = frozenset(ids)
+    depends = {}
+    for step_id, step in zip(ids, steps):
+        if "expression" in step:
+            depends[step_id] = _code_names(compile_expression(step["expression"], known)) & known
+        else:
+            name = step.get("function_name")
+            if name in PLAN_EXCLUDED_TOOLS or mcp._tool_manager.get_tool(name) is None:
+                raise ValueError(f"Step {step_id}: unknown or excluded tool {name!r}")
+            depends[step_id] = _plan_references(step.get("parameters") or [])
+            if depends[step_id] - known:
+                raise ValueError(f"Step {step_id} references unknown steps {sorted(depends[step_id] - known)}")
+    waves, done = [], set()
+    while len(done) < len(ids):
+        ready = [step_id for step_id in ids if step_id not in done and depends[step_id] <= done]
+        if not ready:
+            raise ValueError("Plan steps reference each other in a cycle")
+        waves.append(ready)
+        done.update(ready)
+    return ids, waves
+
+
+def _plan_value(result):
+    """Plain value of a tool result for use in later steps; big ints the tool returned as decimal
+    strings are exact ints again, so later steps compute with numbers rather than text"""
+    if isinstance(result, TextContent):
+        try:
+            result = json.loads(result.text)
+        except ValueError:
+            return result.text
+    return _from_exact_json(result)
+
+
+async def _run_step(step, values):
+    if "expression" in step:
+        # expressions over big ints can take seconds; other calls keep the event loop meanwhile
+        return await run_in_thread_pool(evaluate_expression)(step["expression"], values)
+    name = step["function_name"]
+    tool = mcp._tool_manager.get_tool(name)
+    params = _resolve_references(step.get("parameters") or [], values)
+    if isinstance(params, dict):
+        arguments = params
+    else:
+        names = list(tool.parameters.get("properties", {}))
+        if len(params) > len(names):
+            raise ValueError(f"{name} takes at most {len(names)} parameters, got {len(params)}")
+        arguments = dict(zip(names, params))
+    _fit_string_parameters(tool, arguments)
+    with tracer.span(f"plan.{name}"):
+        result = await mcp._tool_manager.call_tool(name, arguments)
+    if isinstance(result, (int, float)):
+        return result
+    # parsing a million-digit string takes about a second; keep it off the event loop
+    return await run_in_thread_pool(_plan_value)(result)
+
+
+@mcp.tool()
+async def evaluate_plan(steps: list) -> dict:
+    """Run several calculation steps in one call. Each step is {"id": "a", "function_name": "add", "parameters": [2, 3]} or {"id": "b", "expression": "sqrt(a)"}; "$a" in parameters and bare ids in expressions use earlier results. Returns every step's value and the last one as result."""
+    logger.debug("CALLED: evaluate_plan(steps: list) -> dict:")
+    ids, waves = _check_plan(steps)
+    if any(step.get("function_name") in PLAN_UNCACHED_TOOLS for step in steps):
+        return await _run_plan(steps, ids, waves)
+    # cached like a @pure tool unless a step's result can change between identical calls
+    key = ("evaluate_plan", _freeze(steps))
+    return await result_cache.get_or_compute_async(key, lambda: _run_plan(steps, ids, waves))
+
+
+async def _run_plan(steps, ids, waves):
+    by_id = {step_id: step for step_id, step in zip(ids, steps)}
+    values = {}
+    for wave in waves:
+        try:
+            results = await asyncio.gather(*(_run_step(by_id[step_id], values) for step_id in wave))
+        except Exception as e:
+            raise ValueError(f"Plan step failed: {e}") from e
+        values.update(zip(wave, results))
+    # later steps used the exact ints; only the reply needs them JSON-sized, and encoding
+    # million-digit values is as slow as computing them
+    reply = {"values": {step_id: values[step_id] for step_id in ids}, "result": values[ids[-1]]}
+    return await run_in_thread_pool(_exact_json)(reply)
+
 #addition tool
 @mcp.tool()
 def add(a: int, b: int) -> int:
     """Add two numbers"""
-    print("CALLED: add(a: int, b: int) -> int:")
+    logger.debug("CALLED: add(a: int, b: int) -> int:")
     return int(a + b)
 
 @mcp.tool()
 def add_list(l: list) -> int:
     """Add all numbers in a list"""
-    print("CALLED: add(l: list) -> int:")
+    logger.debug("CALLED: add(l: list) -> int:")
     return sum(l)
 
 # subtraction tool
 @mcp.tool()
 def subtract(a: int, b: int) -> int:
     """Subtract two numbers"""
-    print("CALLED: subtract(a: int, b: int) -> int:")
+    logger.debug("CALLED: subtract(a: int, b: int) -> int:")
     return int(a - b)
 
 # multiplication tool
 @mcp.tool()
 def multiply(a: int, b: int) -> int:
     """Multiply two numbers"""
-    print("CALLED: multiply(a: int, b: int) -> int:")
+    logger.debug("CALLED: multiply(a: int, b: int) -> int:")
     return int(a * b)
 
 #  division tool
 @mcp.tool() 
 def divide(a: int, b: int) -> float:
     """Divide two numbers"""
-    print("CALLED: divide(a: int, b: int) -> float:")
+    logger.debug("CALLED: divide(a: int, b: int) -> float:")
     return float(a / b)
 
+# BIG NUMBER ENGINE
+# power and factorial results can run to millions of digits. Decimal conversion is done by
+# divide and conquer so it stays subquadratic and is not capped by sys.get_int_max_str_digits(),
+# and output="summary" describes a result from logarithms without ever building it.
+
+BIG_OUTPUTS = ("full", "summary")
+MAX_FULL_DIGITS = 1_000_000
+MAX_FACTORIAL_MOD_N = 10_000_000
+DECIMAL_CHUNK_BITS = 3000  # ~900 digits, small enough for a plain str()
+DECIMAL_CHUNK_DIGITS = 900
+SUMMARY_EXACT_DIGITS = 1000
+SUMMARY_TRAILING_DIGITS = 12
+SUMMARY_MODULUS = 10 ** SUMMARY_TRAILING_DIGITS
+SUMMARY_LOG_PRECISION = 40  # significant digits of the logarithms behind a summary
+_DECIMAL_PI = decimal.Decimal("3.141592653589793238462643383279502884197")
+LOG10_2 = math.log10(2)
+
+
+def int_to_decimal(n):
+    """Decimal string of n. The binary halves are converted separately and joined with
+    decimal-module arithmetic, so no step divides a huge int and the cost stays subquadratic"""
+    if n < 0:
+        return "-" + int_to_decimal(-n)
+    if n.bit_length() <= DECIMAL_CHUNK_BITS:
+        return str(n)
+    powers_of_two = {}
+
+    def convert(value, bits):
+        if bits <= DECIMAL_CHUNK_BITS:
+            return decimal.Decimal(str(value))
+        half = bits >> 1
+        if half not in powers_of_two:
+            powers_of_two[half] = decimal.Decimal(2) ** half
+        high, low = value >> half, value & ((1 << half) - 1)
+        return convert(high, bits - half) * powers_of_two[half] + convert(low, half)
+
+    with decimal.localcontext() as ctx:
+        ctx.prec = decimal.MAX_PREC
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.traps[decimal.Inexact] = True
+        return str(convert(n, n.bit_length()))
+
+
+def decimal_to_int(text):
+    """int of a decimal string of any length: the inverse of int_to_decimal. Halves of the digits
+    are parsed separately and joined, so int() never sees more than DECIMAL_CHUNK_DIGITS at once"""
+    if text.startswith("-"):
+        return -decimal_to_int(text[1:])
+    powers_of_ten = {}
+
+    def convert(start, stop):
+        if stop - start <= DECIMAL_CHUNK_DIGITS:
+            return int(text[start:stop])
+        low = (stop - start) >> 1
+        if low not in powers_of_ten:
+            powers_of_ten[low] = 10 ** low
+        return convert(start, stop - low) * powers_of_ten[low] + convert(stop - low, stop)
+
+    return convert(0, len(text))
+
+
+def _full_result(value):
+    """Return value as an int when it fits in JSON, otherwise as an exact decimal string"""
+    digits = value.bit_length() * LOG10_2
+    if digits > MAX_FULL_DIGITS:
+        raise ValueError(f"Result has about {int(digits)} digits; use output='summary' or the _mod tool")
+    if digits > sys.get_int_max_str_digits():
+        return int_to_decimal(value)
+    return value
+
+
+def _exact_json(value):
+    """value with every int inside it passed through _full_result"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return _full_result(value)
+    if isinstance(value, (list, tuple)):
+        return [_exact_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _exact_json(v) for k, v in value.items()}
+    return value
+
+
+_LONG_DECIMAL = re.compile(r"-?[0-9]+")
+
+
+def _from_exact_json(value):
+    """Inverse of _exact_json: decimal strings too long for a JSON int become ints again"""
+    if isinstance(value, str):
+        if len(value) > sys.get_int_max_str_digits() and _LONG_DECIMAL.fullmatch(value):
+            return decimal_to_int(value)
+        return value
+    if isinstance(value, list):
+        return [_from_exact_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _from_exact_json(v) for k, v in value.items()}
+    return value
+
+
+def _summary(log10_value, trailing, exact=None):
+    """Describe a huge positive integer from its base-10 logarithm (a Decimal) and its last digits"""
+    if exact is not None:
+        text = int_to_decimal(exact)
+        return {
+            "digits": len(text),
+            "log10": float(log10_value),
+            "leading_digits": text[:SUMMARY_TRAILING_DIGITS],
+            "trailing_digits": text[-SUMMARY_TRAILING_DIGITS:],
+            "scientific": f"{text[0]}.{text[1:16] or '0'}e+{len(text) - 1}",
+        }
+    exponent = math.floor(log10_value)
+    # the integer part of the log eats into its significant digits
+    reliable = max(1, min(SUMMARY_TRAILING_DIGITS, SUMMARY_LOG_PRECISION - 2 - len(str(exponent))))
+    with decimal.localcontext() as ctx:
+        ctx.prec = SUMMARY_LOG_PRECISION
+        # truncate rather than round, so 4.61299... never shows as 4.6130
+        scaled = math.floor(decimal.Decimal(10) ** (log10_value - exponent + reliable - 1))
+    if scaled >= 10 ** reliable:
+        # the fractional part of the log was within rounding error of 1
+        scaled //= 10
+        exponent += 1
+    leading = str(scaled)
+    return {
+        "digits": exponent + 1,
+        "log10": float(log10_value),
+        "leading_digits": leading,
+        "trailing_digits": trailing,
+        "scientific": f"{leading[0]}.{leading[1:] or '0'}e+{exponent}",
+    }
+
+
+def _log10_power(a, b):
+    """log10(|a| ** b) as a Decimal; the float b * log10(a) loses the leading digits for large b"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = SUMMARY_LOG_PRECISION
+        return decimal.Decimal(abs(a)).log10() * b
+
+
+def _is_near_integer(x):
+    return abs(x - round(x)) < 1e-9
+
+
 # power tool
 @mcp.tool()
-def power(a: int, b: int) -> int:
-    """Power of two numbers. Only accepts integer values for both base and exponent."""
-    print("CALLED: power(a: int, b: int) -> int:")
-    return int(a ** b)
+@pure
+@cpu_bound
+def power(a: int, b: int, output: str = "full") -> int | str | dict:
+    """Power of two numbers. Only accepts integer values for both base and exponent.
+    output='summary' returns digit count, log10, leading and trailing digits instead of the full value."""
+    logger.debug("CALLED: power(a: int, b: int, output: str = \"full\") -> int | str | dict:")
+    if output not in BIG_OUTPUTS:
+        raise ValueError(f"output must be one of {BIG_OUTPUTS}")
+    if b < 0 or abs(a) < 2:
+        return int(a ** b)
+    log10_value = b * math.log10(abs(a))
+    if output == "full":
+        if log10_value > MAX_FULL_DIGITS:
+            raise ValueError(f"Result has about {int(log10_value)} digits; use output='summary' or power_mod")
+        return _full_result(a ** b)
+    if log10_value < SUMMARY_EXACT_DIGITS or (_is_near_integer(log10_value) and log10_value < MAX_FULL_DIGITS):
+        # small results are cheap to build, and the float cannot tell 10**k - 1 from 10**k
+        summary = _summary(log10_value, "", exact=abs(a) ** b)
+    else:
+        trailing = str(pow(abs(a), b, SUMMARY_MODULUS)).zfill(SUMMARY_TRAILING_DIGITS)
+        summary = _summary(_log10_power(a, b), trailing)
+    summary["negative"] = a < 0 and b % 2 == 1
+    return summary
+
+
+@mcp.tool()
+@cpu_bound
+def power_mod(a: int, b: int, m: int) -> int:
+    """(a ** b) mod m computed by modular exponentiation, without building a ** b"""
+    logger.debug("CALLED: power_mod(a: int, b: int, m: int) -> int:")
+    return pow(a, b, m)
 
 # square root tool
 @mcp.tool()
 def sqrt(a: int) -> float:
     """Square root of a number"""
-    print("CALLED: sqrt(a: int) -> float:")
+    logger.debug("CALLED: sqrt(a: int) -> float:")
     return float(a ** 0.5)
 
 # cube root tool
 @mcp.tool()
 def cbrt(a: int) -> float:
     """Cube root of a number"""
-    print("CALLED: cbrt(a: int) -> float:")
+    logger.debug("CALLED: cbrt(a: int) -> float:")
     return float(a ** (1/3))
 
+def _log10_factorial(a):
+    """log10(a!) as a Decimal; math.lgamma is off by tens of ulps for large a,
+    which is enough to change the leading digits of a summary"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = SUMMARY_LOG_PRECISION
+        if a < 25:
+            return decimal.Decimal(math.factorial(a)).log10()
+        z = decimal.Decimal(a + 1)
+        # Stirling series for ln(gamma(z)); the next term is below 1e-22 from z = 26
+        ln_gamma = ((z - decimal.Decimal("0.5")) * z.ln() - z + (2 * _DECIMAL_PI).ln() / 2
+                    + 1 / (12 * z) - 1 / (360 * z ** 3) + 1 / (1260 * z ** 5) - 1 / (1680 * z ** 7)
+                    + 1 / (1188 * z ** 9) - 691 / (360360 * z ** 11) + 1 / (156 * z ** 13))
+        return ln_gamma / decimal.Decimal(10).ln()
+
+
 # factorial tool
 @mcp.tool()
-def factorial(a: int) -> int:
-    """factorial of a number"""
-    print("CALLED: factorial(a: int) -> int:")
-    return int(math.factorial(a))
+@pure
+@cpu_bound
+def factorial(a: int, output: str = "full") -> int | str | dict:
+    """factorial of a number.
+    output='summary' returns digit count, log10, leading and trailing digits instead of the full value."""
+    logger.debug("CALLED: factorial(a: int, output: str = \"full\") -> int | str | dict:")
+    if output not in BIG_OUTPUTS:
+        raise ValueError(f"output must be one of {BIG_OUTPUTS}")
+    if a < 0:
+        raise ValueError("factorial() not defined for negative values")
+    log10_value = _log10_factorial(a)
+    if output == "full":
+        if log10_value > MAX_FULL_DIGITS:
+            raise ValueError(f"Result has about {int(log10_value)} digits; use output='summary' or factorial_mod")
+        return _full_result(math.factorial(a))
+    trailing_zeros, power_of_5 = 0, 5
+    while power_of_5 <= a:
+        trailing_zeros += a // power_of_5
+        power_of_5 *= 5
+    if a < 25:
+        summary = _summary(log10_value, "", exact=math.factorial(a))
+    else:
+        if trailing_zeros >= SUMMARY_TRAILING_DIGITS:
+            trailing = "0" * SUMMARY_TRAILING_DIGITS
+        else:
+            trailing = str(_factorial_mod(a, SUMMARY_MODULUS)).zfill(SUMMARY_TRAILING_DIGITS)
+        summary = _summary(log10_value, trailing)
+    summary["trailing_zeros"] = trailing_zeros
+    return summary
+
+
+@mcp.tool()
+@pure
+@cpu_bound
+def factorial_mod(n: int, m: int) -> int:
+    """n! mod m computed without building n!"""
+    logger.debug("CALLED: factorial_mod(n: int, m: int) -> int:")
+    return _factorial_mod(n, m)
+
+
+def _factorial_mod(n, m):
+    if n < 0 or m <= 0:
+        raise ValueError("factorial_mod needs n >= 0 and m > 0")
+    if n >= m:
+        return 0  # m itself is one of the factors
+    if n > MAX_FACTORIAL_MOD_N:
+        raise ValueError(f"n must be at most {MAX_FACTORIAL_MOD_N}")
+    result = 1 % m
+    for i in range(2, n + 1):
+        result = result * i % m
+    return result
 
 # log tool
 @mcp.tool()
 def log(a: int) -> float:
     """log of a number"""
-    print("CALLED: log(a: int) -> float:")
+    logger.debug("CALLED: log(a: int) -> float:")
     return float(math.log(a))
 
 # remainder tool
 @mcp.tool()
 def remainder(a: int, b: int) -> int:
     """remainder of two numbers divison"""
-    print("CALLED: remainder(a: int, b: int) -> int:")
+    logger.debug("CALLED: remainder(a: int, b: int) -> int:")
     return int(a % b)
 
 # sin tool
 @mcp.tool()
 def sin(a: int) -> float:
     """sin of a number"""
-    print("CALLED: sin(a: int) -> float:")
+    logger.debug("CALLED: sin(a: int) -> float:")
     return float(math.sin(a))
 
 # cos tool
 @mcp.tool()
 def cos(a: int) -> float:
     """cos of a number"""
-    print("CALLED: cos(a: int) -> float:")
+    logger.debug("CALLED: cos(a: int) -> float:")
     return float(math.cos(a))
 
 # tan tool
 @mcp.tool()
 def tan(a: int) -> float:
     """tan of a number"""
-    print("CALLED: tan(a: int) -> float:")
+    logger.debug("CALLED: tan(a: int) -> float:")
     return float(math.tan(a))
 
 # mine tool
 @mcp.tool()
 def mine(a: int, b: int) -> int:
     """special mining tool"""
-    print("CALLED: mine(a: int, b: int) -> int:")
+    logger.debug("CALLED: mine(a: int, b: int) -> int:")
     return int(a - b - b)
 
+# batch tool
+# element-wise kernels for batch_compute, keyed by the name of the scalar tool they mirror
+# (numpy ufunc names, looked up when numpy is first imported)
+BATCH_UNARY_OPS = {
+    "sqrt": "sqrt",
+    "cbrt": "cbrt",
+    "log": "log",
+    "exp": "exp",
+    "sin": "sin",
+    "cos": "cos",
+    "tan": "tan",
+}
+BATCH_BINARY_OPS = {
+    "add": "add",
+    "subtract": "subtract",
+    "multiply": "multiply",
+    "divide": "true_divide",
+    "power": "power",
+    "remainder": "remainder",
+    "mine": lambda a, b: a - b - b,
+}
+# integer operations that can silently wrap around in int64
+BATCH_EXACT_OPS = {"add", "subtract", "multiply", "power", "mine"}
+INT64_LIMIT = 2 ** 62
+
+
+def _batch_kernel(ops, operation):
+    import numpy as np
+    kernel = ops[operation]
+    return getattr(np, kernel) if isinstance(kernel, str) else kernel
+
+
+def _as_batch_array(values, name):
+    """Convert a list (or scalar) of numbers to a numpy array, keeping big ints exact"""
+    import numpy as np
+    array = np.asarray(values)
+    if array.dtype == object:
+        # Python ints beyond int64 land here; keep them as exact objects
+        if not all(isinstance(v, (int, float)) for v in array.flat):
+            raise ValueError(f"{name} must contain only numbers")
+    elif array.dtype.kind not in "biuf":
+        raise ValueError(f"{name} must contain only numbers, got dtype {array.dtype}")
+    elif array.dtype.kind == "b":
+        array = array.astype(np.int64)
+    return array
+
+
+def _check_batch_power(a, b):
+    """Refuse exact powers whose digits together exceed MAX_FULL_DIGITS, like power() does for one"""
+    import numpy as np
+    total = 0.0
+    for base, exponent in zip(*(x.flat for x in np.broadcast_arrays(a, b))):
+        if abs(base) < 2 or exponent <= 0:
+            continue
+        # |base| >= 2 gives at least 0.3 digits per unit of exponent
+        if exponent > 4 * MAX_FULL_DIGITS:
+            total = math.inf
+            break
+        total += exponent * (base.bit_length() * LOG10_2 if isinstance(base, int) else math.log10(abs(base)))
+        if total > MAX_FULL_DIGITS:
+            break
+    if total > MAX_FULL_DIGITS:
+        raise ValueError(f"Results have more than {MAX_FULL_DIGITS} digits in total; use power with output='summary' or power_mod")
+
+
+def _batch_binary(operation, a, b):
+    """Apply a binary kernel, promoting to exact Python ints when int64 would overflow"""
+    import numpy as np
+    kernel = _batch_kernel(BATCH_BINARY_OPS, operation)
+    is_int = a.dtype.kind in "iuO" and b.dtype.kind in "iuO"
+    if operation in ("divide", "remainder") and not np.all(b != 0):
+        raise ZeroDivisionError("division by zero" if operation == "divide" else "integer modulo by zero")
+    if operation == "power" and is_int and (np.asarray(b) < 0).any():
+        # numpy refuses negative integer exponents; power() returns int(a ** b), truncating them
+        a, b = a.astype(object), b.astype(object)
+        _check_batch_power(a, b)
+        return np.frompyfunc(lambda x, y: int(x ** y), 2, 1)(a, b)
+    if is_int and operation in BATCH_EXACT_OPS and object not in (a.dtype, b.dtype):
+        estimate = kernel(a.astype(np.float64), b.astype(np.float64))
+        if np.all(np.abs(estimate) < INT64_LIMIT):
+            return kernel(a, b)
+        a, b = a.astype(object), b.astype(object)
+    if operation == "power" and object in (a.dtype, b.dtype):
+        _check_batch_power(a, b)
+    return kernel(a, b)
+
+
+def _batch_values(result):
+    """Nested list of the results, with ints too long for JSON as exact decimal strings"""
+    import numpy as np
+    if result.dtype == object:
+        finite = np.frompyfunc(lambda v: not isinstance(v, float) or math.isfinite(v), 1, 1)(result).astype(bool)
+    elif result.dtype.kind == "f":
+        finite = np.isfinite(result)
+    else:
+        return result.tolist()
+    if not finite.all():
+        # inf and nan are not JSON; the scalar tools raise here too
+        index = [int(i) for i in np.argwhere(~finite)[0]]
+        raise ValueError(f"math domain error or overflow at index {index if result.ndim > 1 else index[0]}")
+    if result.dtype == object:
+        result = np.frompyfunc(lambda v: _full_result(v) if isinstance(v, int) else v, 1, 1)(result)
+    return np.asarray(result).tolist()
+
+
+@mcp.tool()
+def batch_compute(operation: str, a: list, b: list | int | float | None = None) -> list | dict:
+    """Apply a calculator operation element-wise over whole lists in one call.
+    Unary operations: sqrt, cbrt, log, exp, sin, cos, tan (pass only a).
+    Binary operations: add, subtract, multiply, divide, power, remainder, mine (pass a and b).
+    b may be a single number or a list; shapes broadcast like numpy. A flat result is a list,
+    a nested one is {"shape": [...], "values": [[...], ...]}."""
+    logger.debug("CALLED: batch_compute(operation: str, a: list, b: list | int | float | None = None) -> list | dict:")
+    import numpy as np
+    x = _as_batch_array(a, "a")
+    # out-of-domain values are reported by _batch_values instead of warned about
+    with np.errstate(all="ignore"):
+        if operation in BATCH_UNARY_OPS:
+            if b is not None:
+                raise ValueError(f"{operation} takes only one list")
+            result = _batch_kernel(BATCH_UNARY_OPS, operation)(x.astype(np.float64))
+        elif operation in BATCH_BINARY_OPS:
+            if b is None:
+                raise ValueError(f"{operation} needs a second list or number b")
+            y = _as_batch_array(b, "b")
+            try:
+                np.broadcast_shapes(x.shape, y.shape)
+            except ValueError:
+                raise ValueError(f"Cannot broadcast shapes {x.shape} and {y.shape}")
+            result = _batch_binary(operation, x, y)
+        else:
+            supported = sorted(BATCH_UNARY_OPS) + sorted(BATCH_BINARY_OPS)
+            raise ValueError(f"Unknown operation {operation}. Supported: {', '.join(supported)}")
+    result = np.asarray(result)
+    values = _batch_values(result)
+    if result.ndim > 1:
+        # FastMCP flattens nested lists into one content item per number
+        return {"shape": list(result.shape), "values": values}
+    return values
+
 # @mcp.tool()
 # def create_thumbnail(image_path: str) -> Image:
 #     """Create a thumbnail from an image"""
@@ -257,27 +1731,391 @@ def mine(a: int, b: int) -> int:
 #     return Image(data=img.tobytes(), format="png")
 
 @mcp.tool()
+@pure
 def strings_to_chars_to_int(string: str) -> list[int]:
     """Return the ASCII values of the characters in a word"""
-    print("CALLED: strings_to_chars_to_int(string: str) -> list[int]:")
+    logger.debug("CALLED: strings_to_chars_to_int(string: str) -> list[int]:")
     return [int(ord(char)) for char in string]
 
+# EXPONENTIAL SUMS
+# exp() overflows a float just above 709, so the sum is computed as a log-sum-exp:
+# ln(sum(exp(x))) = max + ln(sum(exp(x - max))). The log (or a mantissa and base-10 exponent)
+# stays exact far beyond the float range, and the whole list is evaluated in NumPy.
+
+EXP_SUM_OUTPUTS = ("auto", "float", "log", "scientific")
+LN_FLOAT_MAX = math.log(sys.float_info.max)
+
+
+def log_sum_exp(values):
+    """ln(sum(exp(values))) for a non-empty float64 array without overflow"""
+    import numpy as np
+    largest = values.max()
+    return float(largest + np.log(np.exp(values - largest).sum()))
+
+
+def _scientific(ln_value):
+    """exp(ln_value) as mantissa and base-10 exponent"""
+    log10_value = ln_value / math.log(10)
+    exponent = math.floor(log10_value)
+    # a float carries ~15 significant digits; the integer part of the log eats into them
+    reliable = max(1, 14 - len(str(abs(exponent))))
+    mantissa = round(10 ** (log10_value - exponent), reliable - 1)
+    if mantissa >= 10:
+        mantissa, exponent = mantissa / 10, exponent + 1
+    return {
+        "mantissa": mantissa,
+        "exponent": exponent,
+        "scientific": f"{mantissa:.{reliable - 1}f}e{exponent:+d}",
+        "ln": ln_value,
+        "log10": log10_value,
+    }
+
+
+def exp_sum_result(ln_value, output):
+    """A sum of exponentials given by its natural log (-inf for an empty sum) in the output form"""
+    if ln_value == -math.inf:
+        if output in ("log", "scientific"):
+            raise ValueError("The sum of an empty list is 0, which has no logarithm")
+        return 0.0
+    if output == "log":
+        return ln_value
+    if output in ("auto", "float") and ln_value < LN_FLOAT_MAX:
+        return math.exp(ln_value)
+    if output == "float":
+        raise ValueError(
+            f"The sum is about 10^{ln_value / math.log(10):.1f}, beyond the float range; "
+            "use output='log' or 'scientific'"
+        )
+    return _scientific(ln_value)
+
+
 @mcp.tool()
-def int_list_to_exponential_sum(int_list: list) -> float:
-    """Return sum of exponentials of numbers in a list"""
-    print("CALLED: int_list_to_exponential_sum(int_list: list) -> float:")
-    return sum(math.exp(i) for i in int_list)
+@pure
+def int_list_to_exponential_sum(int_list: list, output: str = "auto") -> float | dict:
+    """Return sum of exponentials of numbers (ints or floats) in a list.
+    output='auto' gives a float, or the scientific form when the sum is too large for a float;
+    'float' always a float, 'log' the natural log of the sum, 'scientific' mantissa, exponent and logs."""
+    logger.debug("CALLED: int_list_to_exponential_sum(int_list: list, output: str = \"auto\") -> float | dict:")
+    import numpy as np
+    if output not in EXP_SUM_OUTPUTS:
+        raise ValueError(f"output must be one of {EXP_SUM_OUTPUTS}")
+    try:
+        values = _as_float_array(int_list).ravel()
+    except OverflowError:
+        raise ValueError("int_list elements must be below 1e308")
+    except (TypeError, ValueError):
+        raise ValueError("int_list must contain only numbers")
+    if not np.isfinite(values).all():
+        raise ValueError("int_list must contain only finite numbers")
+    if values.size == 0:
+        return exp_sum_result(-math.inf, output)
+    if output in ("auto", "float"):
+        with np.errstate(over="ignore"):
+            total = float(np.exp(values).sum())
+        if math.isfinite(total):
+            return total
+    return exp_sum_result(log_sum_exp(values), output)
+
+# FIBONACCI ENGINE
+# The first FIB_TABLE_LIMIT numbers are kept in a table that grows on demand and is shared by
+# every call; single terms beyond it come from fast doubling in O(log n) multiplications.
+
+FIB_TABLE_LIMIT = 20_000  # F(20000) has ~4180 digits, just under Python's int-to-str limit
+FIB_MAX_N = 1_000_000
+FIB_WINDOW_LIMIT = 1000
+FIB_PAGE_CHARS = 1_000_000  # digits of all values in one fibonacci_range page
+FIB_ENCODINGS = ("int", "hex")
+LOG10_PHI = math.log10((1 + math.sqrt(5)) / 2)
+_fib_table = [0, 1]
+_fib_lock = threading.Lock()
+
+
+def _fib_prefix(stop):
+    """Return the shared table, extended to hold at least the first stop Fibonacci numbers"""
+    if len(_fib_table) < stop:
+        with _fib_lock:
+            while len(_fib_table) < stop:
+                _fib_table.append(_fib_table[-1] + _fib_table[-2])
+    return _fib_table
+
+
+def _fib_pair(n):
+    """Return (F(n), F(n+1)) using the table when possible, otherwise fast doubling"""
+    if n + 1 < len(_fib_table):
+        return _fib_table[n], _fib_table[n + 1]
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        # (F(k), F(k+1)) -> (F(2k), F(2k+1)), then step once more for a 1 bit
+        a, b = a * (2 * b - a), a * a + b * b
+        if bit == "1":
+            a, b = b, a + b
+    return a, b
+
+
+def _check_fib_index(name, value):
+    if value < 0:
+        raise ValueError(f"{name} must be non-negative")
+    if value > FIB_MAX_N:
+        raise ValueError(f"{name} must be at most {FIB_MAX_N}")
+
+
+def _encode_fib(value, encoding):
+    return hex(value) if encoding == "hex" else _full_result(value)
+
+
+def _encoded_chars(value, encoding):
+    """Length of a value once encoded, from its bit length"""
+    bits = value.bit_length()
+    return bits // 4 + 3 if encoding == "hex" else int(bits * LOG10_2) + 1
+
+
+def _fib_prefix_digits(n):
+    """Estimated decimal digits of F(0) .. F(n - 1) together; F(k) has about k * log10(phi) digits"""
+    return int(LOG10_PHI * n * (n - 1) / 2) + n
+
 
 @mcp.tool()
+@pure
 def fibonacci_numbers(n: int) -> list:
-    """Return the first n Fibonacci Numbers"""
-    print("CALLED: fibonacci_numbers(n: int) -> list:")
+    """Return the first n Fibonacci Numbers (about 1M digits at most, n up to ~3000).
+    For larger n use fibonacci_range to page through them."""
+    logger.debug("CALLED: fibonacci_numbers(n: int) -> list:")
     if n <= 0:
         return []
-    fib_sequence = [0, 1]
-    for _ in range(2, n):
-        fib_sequence.append(fib_sequence[-1] + fib_sequence[-2])
-    return fib_sequence[:n]
+    # the same output budget as one fibonacci_range page
+    if n > FIB_TABLE_LIMIT or _fib_prefix_digits(n) > FIB_PAGE_CHARS:
+        raise ValueError(f"the first {n} Fibonacci numbers are too long for one reply; "
+                         "use fibonacci_range to page through them")
+    return _fib_prefix(n)[:n]
+
+
+@mcp.tool()
+@pure
+@cpu_bound
+def fibonacci_nth(n: int, encoding: str = "int") -> int | str:
+    """Return the n-th Fibonacci number (F(0) = 0). encoding is 'int' (an exact decimal string once it
+    is too long for a JSON integer) or 'hex' (compact for huge values)."""
+    logger.debug("CALLED: fibonacci_nth(n: int, encoding: str = \"int\") -> int | str:")
+    _check_fib_index("n", n)
+    if encoding not in FIB_ENCODINGS:
+        raise ValueError(f"encoding must be one of {FIB_ENCODINGS}")
+    return _encode_fib(_fib_pair(n)[0], encoding)
+
+
+@mcp.tool()
+def fibonacci_range(start: int, stop: int, encoding: str = "int") -> dict:
+    """Return Fibonacci numbers F(start) .. F(stop - 1), at most 1000 and about 1M digits per call.
+    Use next_start from the result to fetch the following page. encoding is 'int' or 'hex'."""
+    logger.debug("CALLED: fibonacci_range(start: int, stop: int, encoding: str = \"int\") -> dict:")
+    _check_fib_index("start", start)
+    _check_fib_index("stop", stop)
+    if encoding not in FIB_ENCODINGS:
+        raise ValueError(f"encoding must be one of {FIB_ENCODINGS}")
+    stop = max(start, min(stop, start + FIB_WINDOW_LIMIT))
+    if stop <= FIB_TABLE_LIMIT:
+        terms = iter(_fib_prefix(stop)[start:stop])
+    else:
+        terms = _fib_terms(start, stop)
+    # the page ends early once its digits would pass FIB_PAGE_CHARS, but always holds one value
+    values, chars = [], 0
+    for value in terms:
+        chars += _encoded_chars(value, encoding)
+        if values and chars > FIB_PAGE_CHARS:
+            break
+        values.append(value)
+    stop = start + len(values)
+    return {
+        "start": start,
+        "stop": stop,
+        "encoding": encoding,
+        "values": [_encode_fib(v, encoding) for v in values],
+        "next_start": stop,
+    }
+
+
+def _fib_terms(start, stop):
+    a, b = _fib_pair(start)
+    for _ in range(start, stop):
+        yield a
+        a, b = b, a + b
+
+
+# DATASETS
+# Numeric files in CALCULATOR_DATA_DIR are served as dataset://{name} and reduced where they lie
+# by the dataset_* tools, so their numbers never pass through the prompt: the LLM names a dataset
+# and gets scalars back. Files are memory-mapped and reduced in blocks of DATASET_CHUNK_ITEMS,
+# which keeps temporaries small and lets a sum over a multi-GB file run at memory bandwidth.
+
+DATA_DIR = os.getenv("CALCULATOR_DATA_DIR", "datasets")
+# files change under the same name, so plans calling these tools are not cached
+PLAN_UNCACHED_TOOLS.update({"list_datasets", "dataset_sum", "dataset_exp_sum", "dataset_min_max", "dataset_slice"})
+DATASET_CHUNK_ITEMS = 1 << 20
+DATASET_WINDOW_LIMIT = 1000
+# .npy files carry their own dtype and shape; raw files are little-endian with the dtype as suffix
+DATASET_RAW_DTYPES = {
+    ".float64": "<f8", ".float32": "<f4",
+    ".int64": "<i8", ".int32": "<i4", ".int16": "<i2", ".int8": "i1",
+    ".uint64": "<u8", ".uint32": "<u4", ".uint16": "<u2", ".uint8": "u1",
+}
+DATASET_SUFFIXES = (".npy", *DATASET_RAW_DTYPES)
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def _dataset_path(name):
+    if not name or not all(c.isalnum() or c in "_-." for c in name) or name.startswith("."):
+        raise ValueError(f"Invalid dataset name {name!r}")
+    for suffix in DATASET_SUFFIXES:
+        path = os.path.join(DATA_DIR, name + suffix)
+        if os.path.isfile(path):
+            return path
+    raise ValueError(f"Unknown dataset {name!r}; list_datasets shows the available ones")
+
+
+def open_dataset(name):
+    """Dataset name as a flat, read-only memory-mapped array, reopened when its file changes"""
+    import numpy as np
+    path = _dataset_path(name)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _datasets_lock:
+        cached = _datasets.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    suffix = os.path.splitext(path)[1]
+    if suffix == ".npy":
+        data = np.load(path, mmap_mode="r")
+    elif stat.st_size == 0:
+        data = np.empty(0, dtype=DATASET_RAW_DTYPES[suffix])  # an empty file cannot be mapped
+    else:
+        data = np.memmap(path, dtype=DATASET_RAW_DTYPES[suffix], mode="r")
+    if data.dtype.kind not in "biuf":
+        raise ValueError(f"Dataset {name!r} is not numeric (dtype {data.dtype})")
+    data = data.reshape(-1, order="A")  # storage order, so no copy
+    with _datasets_lock:
+        _datasets[name] = (key, data)
+    return data
+
+
+def _dataset_window(name, start, stop):
+    data = open_dataset(name)
+    stop = len(data) if stop is None else min(stop, len(data))
+    if start < 0 or stop < start:
+        raise ValueError(f"Invalid window start={start}, stop={stop} for dataset {name!r} of length {len(data)}")
+    return data[start:stop]
+
+
+def _chunks(data):
+    for i in range(0, len(data), DATASET_CHUNK_ITEMS):
+        yield data[i:i + DATASET_CHUNK_ITEMS]
+
+
+def dataset_info(name):
+    data = open_dataset(name)
+    return {
+        "name": name,
+        "dtype": str(data.dtype),
+        "length": len(data),
+        "bytes": data.nbytes,
+    }
+
+
+@mcp.resource("dataset://{name}")
+def get_dataset(name: str) -> str:
+    """Type and length of a dataset; its numbers stay on the server"""
+    return json.dumps(dataset_info(name))
+
+
+@mcp.tool()
+def list_datasets() -> list:
+    """Return the datasets on the server with their dtype and length. Pass a dataset name to the dataset_* tools."""
+    logger.debug("CALLED: list_datasets() -> list:")
+    if not os.path.isdir(DATA_DIR):
+        return []
+    names = sorted({
+        entry.name[: -len(suffix)]
+        for entry in os.scandir(DATA_DIR)
+        for suffix in DATASET_SUFFIXES
+        if entry.is_file() and entry.name.endswith(suffix)
+    })
+    datasets = []
+    for name in names:
+        try:
+            datasets.append(dataset_info(name))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping dataset %s: %s", name, e)
+    return datasets
+
+
+@mcp.tool()
+def dataset_sum(name: str, start: int = 0, stop: int | None = None) -> int | float:
+    """Return the sum of a dataset's elements start .. stop - 1 (default: all of them)"""
+    logger.debug("CALLED: dataset_sum(name: str, start: int = 0, stop: int | None = None) -> int | float:")
+    import numpy as np
+    data = _dataset_window(name, start, stop)
+    if data.dtype.kind == "f":
+        return math.fsum(float(chunk.sum(dtype=np.float64)) for chunk in _chunks(data))
+    total = 0
+    for chunk in _chunks(data):
+        if data.dtype.itemsize < 8:
+            total += int(chunk.sum(dtype=np.int64))  # 2^32 * DATASET_CHUNK_ITEMS fits
+            continue
+        bound = max(abs(int(chunk.min())), abs(int(chunk.max()))) if chunk.size else 0
+        if bound * len(chunk) < INT64_LIMIT:
+            total += int(chunk.sum(dtype=np.int64))
+        else:
+            total += sum(chunk.tolist())  # exact for values int64 sums would overflow
+    return total
+
+
+@mcp.tool()
+def dataset_exp_sum(name: str, start: int = 0, stop: int | None = None, output: str = "auto") -> float | dict:
+    """Return the sum of exponentials of a dataset's elements start .. stop - 1 (default: all).
+    output is 'auto', 'float', 'log' or 'scientific' as for int_list_to_exponential_sum."""
+    logger.debug("CALLED: dataset_exp_sum(name: str, start: int = 0, stop: int | None = None, output: str = \"auto\") -> float | dict:")
+    import numpy as np
+    if output not in EXP_SUM_OUTPUTS:
+        raise ValueError(f"output must be one of {EXP_SUM_OUTPUTS}")
+    data = _dataset_window(name, start, stop)
+    # log_sum_exp one chunk at a time, in place in one float64 buffer that stays in cache
+    buffer = np.empty(min(len(data), DATASET_CHUNK_ITEMS))
+    ln_value = -math.inf
+    for chunk in _chunks(data):
+        largest = float(chunk.max())
+        if not math.isfinite(largest):
+            raise ValueError(f"Dataset {name!r} contains non-finite numbers")
+        values = buffer[:len(chunk)]
+        np.subtract(chunk, largest, out=values)
+        np.exp(values, out=values)
+        ln_value = float(np.logaddexp(ln_value, largest + math.log(values.sum())))
+    return exp_sum_result(ln_value, output)
+
+
+@mcp.tool()
+def dataset_min_max(name: str, start: int = 0, stop: int | None = None) -> dict:
+    """Return the smallest and largest of a dataset's elements start .. stop - 1 (default: all)"""
+    logger.debug("CALLED: dataset_min_max(name: str, start: int = 0, stop: int | None = None) -> dict:")
+    data = _dataset_window(name, start, stop)
+    if not len(data):
+        raise ValueError(f"The window of dataset {name!r} is empty")
+    return {"min": data.min().item(), "max": data.max().item()}
+
+
+@mcp.tool()
+def dataset_slice(name: str, start: int, stop: int) -> dict:
+    """Return a dataset's elements start .. stop - 1, at most 1000 per call.
+    Use next_start from the result to fetch the following window (null at the end)."""
+    logger.debug("CALLED: dataset_slice(name: str, start: int, stop: int) -> dict:")
+    length = len(open_dataset(name))
+    data = _dataset_window(name, start, max(start, min(stop, start + DATASET_WINDOW_LIMIT)))
+    stop = start + len(data)
+    return {
+        "name": name,
+        "start": start,
+        "stop": stop,
+        "values": data.tolist(),
+        "next_start": stop if stop < length else None,
+    }
 
 
 # @mcp.tool()
@@ -524,7 +2362,7 @@ def fibonacci_numbers(n: int) -> list:
 @mcp.resource("greeting://{name}")
 def get_greeting(name: str) -> str:
     """Get a personalized greeting"""
-    print("CALLED: get_greeting(name: str) -> str:")
+    logger.debug("CALLED: get_greeting(name: str) -> str:")
     return f"Hello, {name}!"
 
 
@@ -532,7 +2370,7 @@ def get_greeting(name: str) -> str:
 @mcp.prompt()
 def review_code(code: str) -> str:
     return f"Please review this code:\n\n{code}"
-    print("CALLED: review_code(code: str) -> str:")
+    logger.debug("CALLED: review_code(code: str) -> str:")
 
 @mcp.prompt()
 def debug_error(error: str) -> list[base.Message]:
@@ -715,7 +2553,7 @@ def debug_error(error: str) -> list[base.Message]:
 
 if __name__ == "__main__":
     # Check if running with mcp dev command
-    print("STARTING")
+    logger.info("Starting calculator server")
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run()  # Run without transport for dev server
     else:
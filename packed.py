@@ -0,0 +1,119 @@
+"""Packed numeric arrays for tool arguments and results, shared by mcp-client.py and mcp-server.py.
+
+A JSON list of a million numbers is several MB of text and one Python object per element on
+each side, and FastMCP sends a list result back as one content item per element. A packed
+array is a single JSON object instead:
+
+    {"__packed__": "<i8", "shape": [n], "data": "<base64 of the little-endian bytes>"}
+
+with dtype "<i8" (int64) or "<f8" (float64). Packing copies the buffer once into base64;
+unpacking wraps the decoded bytes in a memoryview (or a NumPy array) without copying again.
+Lists with ints beyond int64 (or beyond 2**53 next to floats), non-numbers, or fewer than
+min_items elements stay JSON.
+"""
+import array
+import base64
+import math
+import sys
+
+PACKED_KEY = "__packed__"
+TYPECODES = {"<i8": "q", "<f8": "d"}
+DTYPES = {typecode: dtype for dtype, typecode in TYPECODES.items()}
+MIN_ITEMS = 1024
+
+
+def is_packed(value):
+    return isinstance(value, dict) and PACKED_KEY in value
+
+
+def _buffer(values):
+    """(dtype, 8-byte native-order buffer) for a flat sequence of numbers, or None"""
+    if hasattr(values, "dtype") and hasattr(values, "tobytes"):
+        # NumPy array: only the dtype changes, no Python objects are created
+        kind = values.dtype.kind
+        if kind not in "biuf" or (kind == "u" and values.size and values.max() > 2**63 - 1):
+            return None
+        dtype = "<f8" if kind == "f" else "<i8"
+        return dtype, values.astype(dtype, copy=False).tobytes()
+    if isinstance(values, array.array) and values.typecode in DTYPES and values.itemsize == 8:
+        return DTYPES[values.typecode], values
+    if isinstance(values, memoryview) and values.format in DTYPES:
+        return DTYPES[values.format], values
+    try:
+        return "<i8", array.array("q", values)
+    except OverflowError:
+        return None  # ints beyond int64 stay exact as JSON
+    except TypeError:
+        pass
+    try:
+        buffer = array.array("d", values)
+    except (TypeError, OverflowError):
+        return None
+    if int in set(map(type, values)) and any(type(v) is int and abs(v) > 2**53 for v in values):
+        return None  # float64 would round these ints; a mixed list keeps them exact as JSON
+    return "<f8", buffer
+
+
+def pack(values, min_items=MIN_ITEMS):
+    """Packed form of a flat list, array.array, memoryview or NumPy array of numbers,
+    or None when it is too short or cannot be packed without losing values"""
+    if isinstance(values, (str, bytes)) or getattr(values, "ndim", 1) != 1:
+        return None
+    if len(values) < max(min_items, 1):
+        return None
+    packed = _buffer(values)
+    if packed is None:
+        return None
+    dtype, buffer = packed
+    if sys.byteorder == "big":
+        buffer = array.array(TYPECODES[dtype], bytes(buffer))
+        buffer.byteswap()
+    return {PACKED_KEY: dtype, "shape": [len(values)], "data": base64.b64encode(buffer).decode("ascii")}
+
+
+def _decode(value):
+    if value.get(PACKED_KEY) not in TYPECODES:
+        raise ValueError(f"Invalid packed array: dtype must be one of {sorted(TYPECODES)}")
+    try:
+        typecode = TYPECODES[value[PACKED_KEY]]
+        shape = [int(n) for n in value["shape"]]
+        raw = base64.b64decode(value["data"], validate=True)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid packed array: {e}") from None
+    if len(raw) != 8 * math.prod(shape):
+        raise ValueError(f"Invalid packed array: {len(raw)} bytes do not match shape {shape}")
+    return typecode, shape, raw
+
+
+def unpack(value):
+    """memoryview over the numbers of a packed array; .tolist() gives the plain list"""
+    typecode, shape, raw = _decode(value)
+    if sys.byteorder == "big":
+        swapped = array.array(typecode, raw)
+        swapped.byteswap()
+        raw = swapped.tobytes()
+    return memoryview(raw).cast(typecode, shape)
+
+
+def unpack_array(value):
+    """Read-only NumPy array over the numbers of a packed array"""
+    import numpy as np
+    typecode, shape, raw = _decode(value)
+    return np.frombuffer(raw, dtype=DTYPES[typecode]).reshape(shape)
+
+
+def pack_arguments(arguments, min_items=MIN_ITEMS):
+    """Tool arguments with every packable list replaced by its packed form"""
+    packed = {}
+    for name, value in arguments.items():
+        if isinstance(value, (list, tuple, array.array, memoryview)):
+            value = pack(value, min_items) or value
+        packed[name] = value
+    return packed
+
+
+def unpack_arguments(arguments):
+    """Tool arguments with every packed array replaced by a memoryview over its numbers"""
+    if not any(is_packed(value) for value in arguments.values()):
+        return arguments
+    return {name: unpack(value) if is_packed(value) else value for name, value in arguments.items()}
@@ -0,0 +1,144 @@
+"""Spans shared by mcp-client.py and mcp-server.py.
+
+A span times one operation and records its status and attributes (sizes, tool name, ...).
+Finished spans are appended to a JSON lines file and summed into metrics that render as a
+Prometheus text snapshot. The client passes its trace and span ids to the server in the
+tools/call _meta, so spans from both sides of one query share a trace_id.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def new_id():
+    """Random 16 hex digit id for traces and spans"""
+    return os.urandom(8).hex()
+
+
+def current_span():
+    """The innermost open span in this context, or None"""
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Add attributes to the current span, if there is one"""
+    span = _current_span.get()
+    if span is not None:
+        span["attributes"].update(attributes)
+
+
+def trace_context():
+    """Ids to send along with a request so the other side can join this trace"""
+    span = _current_span.get()
+    if span is None:
+        return {}
+    return {"trace_id": span["trace_id"], "parent_id": span["span_id"]}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Tracer:
+    """Records spans for one service, writes them to path (if set) and keeps per-name metrics"""
+
+    def __init__(self, service, path=None):
+        self.service = service
+        self.path = path
+        self.listeners = []
+        self._file = None
+        self._lock = threading.Lock()
+        # name -> [count, errors, duration sum, bucket counts, {size attribute: total}]
+        self._metrics = {}
+
+    @contextlib.contextmanager
+    def span(self, name, trace_id=None, parent_id=None, **attributes):
+        """Time the body as a span. Without ids it joins the current span's trace,
+        or starts a new trace when there is none."""
+        parent = _current_span.get()
+        if trace_id is None and parent is not None:
+            trace_id, parent_id = parent["trace_id"], parent["span_id"]
+        span = {
+            "service": self.service,
+            "name": name,
+            "trace_id": trace_id or new_id(),
+            "span_id": new_id(),
+            "parent_id": parent_id,
+            "start": time.time(),
+            "duration_ms": 0.0,
+            "status": "ok",
+            "attributes": attributes,
+        }
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span["attributes"]["error"] = type(e).__name__
+            raise
+        finally:
+            span["duration_ms"] = (time.perf_counter() - started) * 1000
+            _current_span.reset(token)
+            self.finish(span)
+
+    def finish(self, span):
+        duration = span["duration_ms"] / 1000
+        with self._lock:
+            metric = self._metrics.get(span["name"])
+            if metric is None:
+                metric = self._metrics[span["name"]] = [0, 0, 0.0, [0] * len(DURATION_BUCKETS), {}]
+            metric[0] += 1
+            metric[1] += span["status"] != "ok"
+            metric[2] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metric[3][i] += 1
+            for key, value in span["attributes"].items():
+                if key.endswith(("_bytes", "_chars")) and isinstance(value, (int, float)):
+                    metric[4][key] = metric[4].get(key, 0) + value
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, "a", buffering=1)
+                self._file.write(json.dumps(span, default=str) + "\n")
+        for listener in self.listeners:
+            listener(span)
+
+    def prometheus(self):
+        """Metrics of all finished spans in the Prometheus text format"""
+        lines = [
+            "# HELP span_duration_seconds Duration of traced operations",
+            "# TYPE span_duration_seconds histogram",
+        ]
+        errors = ["# HELP span_errors_total Traced operations that failed", "# TYPE span_errors_total counter"]
+        sizes = ["# HELP span_size_total Sizes recorded by traced operations", "# TYPE span_size_total counter"]
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+            for name, (count, failed, total, buckets, totals) in metrics:
+                labels = f'service="{_label(self.service)}",name="{_label(name)}"'
+                for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'span_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket}')
+                lines.append(f'span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"span_duration_seconds_sum{{{labels}}} {total:.6f}")
+                lines.append(f"span_duration_seconds_count{{{labels}}} {count}")
+                errors.append(f"span_errors_total{{{labels}}} {failed}")
+                for key, value in sorted(totals.items()):
+                    sizes.append(f'span_size_total{{{labels},attribute="{_label(key)}"}} {value}')
+        return "\n".join(lines + errors + sizes) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w") as f:
+            f.write(self.prometheus())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None